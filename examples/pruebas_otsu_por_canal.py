@@ -0,0 +1,28 @@
+import os
+import sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from processing import aplicar_umbralizacion_rgb
+
+# Una imagen oscura (0-59) y una clara (180-255) en la misma pila: cada una tiene que
+# segmentarse igual que si se procesara sola
+rng = np.random.default_rng(0)
+oscura = rng.integers(0, 60, (40, 50, 3)).astype(np.uint8)
+clara = rng.integers(180, 256, (40, 50, 3)).astype(np.uint8)
+pila = np.stack([oscura, clara])
+
+por_separado = np.stack([aplicar_umbralizacion_rgb(oscura), aplicar_umbralizacion_rgb(clara)])
+en_pila = aplicar_umbralizacion_rgb(pila)
+
+print(f"Blanco por separado: {(por_separado == 255).mean(axis=(1, 2, 3))}")
+print(f"Blanco en pila:      {(en_pila == 255).mean(axis=(1, 2, 3))}")
+assert np.array_equal(en_pila, por_separado), "La pila no da lo mismo que cada imagen por separado"
+
+# Pila de dos ejes (2 x 3 imágenes) con 5 canales
+pila = rng.integers(0, 256, (2, 3, 20, 30, 5)).astype(np.uint8) // rng.integers(1, 8, (2, 3, 1, 1, 1)).astype(np.uint8)
+en_pila = aplicar_umbralizacion_rgb(pila)
+for i in range(2):
+    for j in range(3):
+        assert np.array_equal(en_pila[i, j], aplicar_umbralizacion_rgb(pila[i, j]))
+print("OK")
@@ -0,0 +1,186 @@
+"""
+Genera, sin abrir la interfaz, versiones con ruido de las imágenes de una carpeta para
+cada combinación de tipo de ruido, intensidad y densidad.
+
+Ejemplo:
+    python generar_dataset.py --entrada data --salida results/dataset --tipos gauss rayleigh sal_y_pimienta --intensidades 10 20 50 --densidades 10 20
+
+Los archivos se llaman como los hechos a mano en results/:
+    lena_gray_512_gauss_sigma10_d20.png, lena_gray_512_sal_y_pimienta_d10.png, ...
+La semilla de cada variante sale de la semilla general y del nombre del archivo, así
+que el mismo archivo siempre sale igual aunque cambie la grilla o el orden.
+"""
+import argparse
+import os
+import time
+import zlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from PIL import Image
+
+from processing import aplicar_ruido, aplicar_ruido_sal_y_pimienta, crear_compartido, es_gris
+
+# ===============================((CONFIGURACIÓN))=======================================
+
+# tipo -> (distribución, nombre del parámetro en el archivo)
+TIPOS_DE_RUIDO = {
+    'gauss': (np.random.normal, 'sigma'),
+    'rayleigh': (np.random.rayleigh, 'xi'),
+    'exponencial': (np.random.exponential, 'lambda'),
+    'sal_y_pimienta': (None, None),
+}
+
+EXTENSIONES = ('.png', '.jpg', '.jpeg', '.bmp', '.pgm', '.tif', '.tiff', '.raw')
+
+# PNG sin pérdida en todos los niveles: el 1 comprime menos pero codifica mucho más rápido
+COMPRESION_PNG = 1
+
+# Los RAW no traen su tamaño (ver data/README.TXT): (ancho, alto)
+DIMENSIONES_RAW = {
+    'GIRL.RAW': (389, 164),
+    'BARCO.RAW': (290, 207),
+    'LENA.RAW': (256, 256),
+    'GIRL2.RAW': (256, 256),
+    'FRACTAL.RAW': (200, 200),
+}
+
+# ==================================((LECTURA))==========================================
+
+def leer_imagen(ruta: str):
+    """
+    Devuelve la imagen como array uint8: H x W si es gris (como en la aplicación) o
+    H x W x 3. None si no se puede leer (o es un RAW de tamaño desconocido o incompleto).
+    """
+    nombre = os.path.basename(ruta)
+    if nombre.lower().endswith('.raw'):
+        dimensiones = DIMENSIONES_RAW.get(nombre.upper())
+        if dimensiones is None:
+            print(f"Se saltea {ruta}: RAW de tamaño desconocido")
+            return None
+        ancho, alto = dimensiones
+        datos_raw = np.fromfile(ruta, dtype=np.uint8, count=ancho * alto)
+        if datos_raw.size < ancho * alto:
+            print(f"Se saltea {ruta}: RAW incompleto ({datos_raw.size} de {ancho * alto} bytes)")
+            return None
+        return datos_raw.reshape((alto, ancho))
+
+    try:
+        with Image.open(ruta) as imagen_pil:
+            if es_gris(imagen_pil.mode):
+                return np.asarray(imagen_pil.convert('L'))
+            imagen_np = np.asarray(imagen_pil.convert('RGB'))
+    except OSError as e:
+        print(f"No se pudo leer {ruta}: {e}")
+        return None
+    if es_gris('RGB', imagen_np):
+        return np.ascontiguousarray(imagen_np[:, :, 0]) # RGB con los tres canales iguales: gris
+    return imagen_np
+
+def buscar_imagenes(carpeta: str) -> list:
+    return sorted(os.path.join(carpeta, nombre) for nombre in os.listdir(carpeta) if nombre.lower().endswith(EXTENSIONES))
+
+# ===================================((GRILLA))==========================================
+
+def nombre_de_variante(base: str, tipo: str, intensidad: float, densidad: float) -> str:
+    def numero(valor):
+        return f"{valor:g}".replace('.', 'p') # 0.5 -> 0p5
+    if tipo == 'sal_y_pimienta':
+        return f"{base}_{tipo}_d{numero(densidad)}.png"
+    parametro = TIPOS_DE_RUIDO[tipo][1]
+    return f"{base}_{tipo}_{parametro}{numero(intensidad)}_d{numero(densidad)}.png"
+
+def armar_grilla(tipos: list, intensidades: list, densidades: list) -> list:
+    """(tipo, intensidad, densidad) sin repetir variantes de sal y pimienta (no usa intensidad)."""
+    grilla = []
+    for tipo in tipos:
+        for densidad in densidades:
+            if tipo == 'sal_y_pimienta':
+                grilla.append((tipo, None, densidad))
+            else:
+                grilla.extend((tipo, intensidad, densidad) for intensidad in intensidades)
+    return grilla
+
+# ==================================((TRABAJO))==========================================
+
+def generar_variante(entrada: tuple, ruta_salida: str, tipo: str, intensidad, densidad: float, aplicacion: str, semilla: int, compresion: int = COMPRESION_PNG) -> str:
+    """
+    Corre en el proceso trabajador: entrada es (nombre, forma) de la imagen uint8 en
+    memoria compartida, que se decodificó una sola vez en el proceso principal.
+    """
+    memoria = shared_memory.SharedMemory(name=entrada[0])
+    try:
+        imagen_np = np.ndarray(entrada[1], dtype=np.uint8, buffer=memoria.buf)
+        secuencia = np.random.SeedSequence([semilla, zlib.crc32(os.path.basename(ruta_salida).encode())])
+        if tipo == 'sal_y_pimienta':
+            p = (densidad / 2) / 100 # Igual que en el diálogo de ruido
+            resultado_np = aplicar_ruido_sal_y_pimienta(imagen_np, p, semilla=secuencia, hilos=1)
+        else:
+            resultado_np = aplicar_ruido(imagen_np, aplicacion, d=densidad, distribucion=TIPOS_DE_RUIDO[tipo][0],
+                                         intensidad=intensidad, semilla=secuencia)
+        del imagen_np # Sin vistas vivas para poder cerrar la memoria
+        Image.fromarray(resultado_np.astype(np.uint8, copy=False)).save(ruta_salida, compress_level=compresion)
+    finally:
+        memoria.close()
+    return ruta_salida
+
+def generar_dataset(rutas: list, salida: str, grilla: list, aplicacion: str = "Aditivo", semilla: int = 0, procesos: int = 0, compresion: int = COMPRESION_PNG) -> int:
+    """
+    Genera todas las variantes de todas las imágenes y devuelve cuántas escribió.
+    Cada archivo se escribe apenas está listo; procesos <= 1 lo hace todo en este proceso.
+    """
+    os.makedirs(salida, exist_ok=True)
+    nombres = [os.path.splitext(os.path.basename(ruta))[0].lower() for ruta in rutas]
+    memorias = []
+    try:
+        tareas = []
+        for ruta, base in zip(rutas, nombres):
+            if nombres.count(base) > 1: # barco.png y BARCO.RAW: se agrega la extensión
+                base += "_" + os.path.splitext(ruta)[1][1:].lower()
+            imagen_np = leer_imagen(ruta)
+            if imagen_np is None:
+                continue
+            memoria, compartida = crear_compartido(imagen_np.shape, np.uint8)
+            compartida[...] = imagen_np
+            del compartida
+            memorias.append(memoria)
+
+            for tipo, intensidad, densidad in grilla:
+                ruta_salida = os.path.join(salida, nombre_de_variante(base, tipo, intensidad, densidad))
+                tareas.append(((memoria.name, imagen_np.shape), ruta_salida, tipo, intensidad, densidad, aplicacion, semilla, compresion))
+
+        if procesos <= 1:
+            for tarea in tareas:
+                print(generar_variante(*tarea))
+        else:
+            with ProcessPoolExecutor(max_workers=procesos) as pool:
+                for futuro in as_completed([pool.submit(generar_variante, *tarea) for tarea in tareas]):
+                    print(futuro.result())
+        return len(tareas)
+    finally:
+        for memoria in memorias:
+            memoria.close()
+            memoria.unlink()
+
+# ====================================((CLI))============================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera versiones con ruido de las imágenes de una carpeta.")
+    parser.add_argument("--entrada", default="data", help="Carpeta con las imágenes originales")
+    parser.add_argument("--salida", default=os.path.join("results", "dataset"), help="Carpeta donde se escriben las variantes")
+    parser.add_argument("--tipos", nargs="+", choices=list(TIPOS_DE_RUIDO), default=['gauss', 'rayleigh', 'exponencial'])
+    parser.add_argument("--intensidades", nargs="+", type=float, default=[10, 20, 50], help="σ, ξ o λ según el tipo")
+    parser.add_argument("--densidades", nargs="+", type=float, default=[20], help="Porcentaje de píxeles a afectar")
+    parser.add_argument("--aplicacion", choices=["Aditivo", "Multiplicativo"], default="Aditivo")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--compresion", type=int, choices=range(10), default=COMPRESION_PNG, help="Nivel de compresión PNG (0-9)")
+    args = parser.parse_args()
+
+    grilla = armar_grilla(args.tipos, args.intensidades, args.densidades)
+    inicio = time.perf_counter()
+    cantidad = generar_dataset(buscar_imagenes(args.entrada), args.salida, grilla, args.aplicacion, args.semilla, args.procesos, args.compresion)
+    print(f"{cantidad} imágenes generadas en {time.perf_counter() - inicio:.1f} s")
+
+if __name__ == "__main__":
+    main()
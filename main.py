@@ -18,7 +18,9 @@ from ui_dialogs import (DialogoDimensiones, DialogoResultado, DialogoRecorteConA
 from processing import (aplicar_negativo, aplicar_ecualizacion_histograma, aplicar_filtro,
                         crear_filtro_media, crear_filtro_mediana, crear_filtro_mediana_ponderada, crear_filtro_gaussiano, crear_filtro_realce,
                         crear_filtro_prewitt_x, crear_filtro_prewitt_y, crear_filtro_sobel_x, crear_filtro_sobel_y, aplicar_filtro_combinado,
-                        restar_imagenes, aplicar_umbralizacion_iterativa, aplicar_umbralizacion_de_otsu, aplicar_umbralizacion_rgb
+                        restar_imagenes, umbral_iterativo, aplicar_umbralizacion, aplicar_umbralizacion_de_otsu, aplicar_umbralizacion_rgb,
+                        a_tipo_de_calculo, tipo_de_calculo, tomar_buffer, OPERADORES_PUNTUALES, aplicar_clahe, calcular_histogramas,
+                        aplicar_umbralizacion_multinivel, es_gris, liberar_buffers
                         )
 
 class Redirector:
@@ -57,6 +59,7 @@ class EditorDeImagenes:
 
         self.imagen_original: Optional[Image.Image] = None
         self.imagen_procesada: Optional[Image.Image] = None
+        self._cache_histogramas = None # (imagen, conteos)
         self.pixel_seleccionado: Optional[Tuple[int, int]] = None
         self.on_region_select_callback: Optional[Callable] = None
         self.zoom_level = 1.0
@@ -117,7 +120,8 @@ class EditorDeImagenes:
         config_dist_exponencial = {'titulo': "Histograma Exponencial", 'param_label': "Lambda (λ):", 'distribucion': np.random.exponential}
         barra_menu.add_cascade(label="Histogramas", menu=menu_histogramas)
         menu_histogramas.add_command(label="Niveles de Gris y RGB", image=self.iconos['h_barras'], compound="left", command=lambda: self._iniciar_dialogo(DialogoHistogramas))
-        menu_histogramas.add_command(label="Ecualización", image=self.iconos['h_onda2'], compound="left", command=lambda: self._aplicar_transformacion(self.imagen_procesada, aplicar_ecualizacion_histograma, byn=True))
+        menu_histogramas.add_command(label="Ecualización", image=self.iconos['h_onda2'], compound="left", command=lambda: self._aplicar_con_histograma(aplicar_ecualizacion_histograma))
+        menu_histogramas.add_command(label="Ecualización Adaptativa (CLAHE)", image=self.iconos['h_onda2'], compound="left", command=lambda: self._aplicar_transformacion(self.imagen_procesada, aplicar_clahe, byn=True))
         menu_histogramas.add_separator()
         menu_histogramas.add_command(label="Generador Gaussiano", image=self.iconos['h_n'], compound="left", command=lambda: self._iniciar_dialogo(DialogoHistogramaDist, config=config_dist_gaussiano))
         menu_histogramas.add_command(label="Generador Rayleigh", image=self.iconos['h_r'], compound="left", command=lambda: self._iniciar_dialogo(DialogoHistogramaDist, config=config_dist_rayleigh))
@@ -174,8 +178,12 @@ class EditorDeImagenes:
 
         menu_umbralizacion = tk.Menu(barra_menu, tearoff=0)
         barra_menu.add_cascade(label="Umbralización", menu=menu_umbralizacion)
-        menu_umbralizacion.add_command(label="Umbralización óptima iterativa", image=self.iconos['h_ciclo'], compound="left", command=lambda: self._aplicar_transformacion(self.imagen_procesada, aplicar_umbralizacion_iterativa, byn=True))
-        menu_umbralizacion.add_command(label="Método de umbralización de Otsu", image=self.iconos['h_combinar'], compound="left", command=lambda: self._aplicar_transformacion(self.imagen_procesada, aplicar_umbralizacion_de_otsu, byn=True))
+        menu_umbralizacion.add_command(label="Umbralización óptima iterativa", image=self.iconos['h_ciclo'], compound="left", command=self._aplicar_umbralizacion_iterativa)
+        menu_umbralizacion.add_command(label="Método de umbralización de Otsu", image=self.iconos['h_combinar'], compound="left", command=lambda: self._aplicar_con_histograma(aplicar_umbralizacion_de_otsu))
+        menu_otsu_multinivel = tk.Menu(menu_umbralizacion, tearoff=0)
+        menu_umbralizacion.add_cascade(label="Otsu multinivel", image=self.iconos['h_combinar'], compound="left", menu=menu_otsu_multinivel)
+        for clases in (3, 4, 5):
+            menu_otsu_multinivel.add_command(label=f"{clases} clases", command=lambda clases=clases: self._aplicar_con_histograma(aplicar_umbralizacion_multinivel, clases=clases))
         menu_umbralizacion.add_command(label="Segmentación de imágenes en color", image=self.iconos['h_formas'], compound="left", command=lambda: self._aplicar_transformacion(self.imagen_procesada, aplicar_umbralizacion_rgb))
 
     def _crear_panel_superior(self):
@@ -391,41 +399,47 @@ class EditorDeImagenes:
     @requiere_imagen
     @refrescar_imagen
     def _aplicar_transformacion(self, imagen, funcion, *args, byn=False, **kwargs,):
-        if byn:
-            imagen_np = np.array(imagen.convert('L')).astype(float)
-            print("Transformo en byn!!")
+        self.imagen_procesada = self._calcular_transformacion(imagen, funcion, *args, byn=byn, **kwargs)
+
+    def _calcular_transformacion(self, imagen, funcion, *args, byn=False, **kwargs) -> Image.Image:
+        """Aplica la función a una imagen PIL y devuelve el resultado sin mostrarlo."""
+        modo = 'L' if byn or imagen.mode == 'L' else 'RGB' # Las imágenes grises se procesan como un solo canal (H x W)
+        print("Transformo en byn!!" if modo == 'L' else "Transformo en color!!")
+        pixeles = np.asarray(imagen if imagen.mode == modo else imagen.convert(modo))
+
+        if funcion in OPERADORES_PUNTUALES:
+            imagen_np = pixeles # Se aplican con una tabla de 256 valores directo sobre uint8
         else:
-            imagen_np = np.array(imagen.convert('RGB')).astype(float)
-            print("Transformo en color!!")
+            # La entrada se copia a un buffer reutilizable en vez de reservar uno nuevo por operación
+            entrada = tomar_buffer(pixeles.shape, tipo_de_calculo(), "entrada")
+            imagen_np = a_tipo_de_calculo(pixeles, out=entrada)
 
         resultado_np = funcion(imagen_np, *args, **kwargs)
 
-        self.imagen_procesada = Image.fromarray(resultado_np.astype('uint8')).convert('RGB')
+        return Image.fromarray(resultado_np.astype('uint8', copy=False)) # 'L' si el resultado es de un canal
 
     # --- Niveles de Gris y RGB
 
-    def _tomar_niveles_grisrgb_aplanados(self):
+    def _tomar_histogramas(self) -> dict:
         """
-        Prepara y devuelve un diccionario con los datos aplanados para los 4 histogramas.
+        Devuelve los conteos (256 valores) de gris, rojo, verde y azul de la imagen
+        procesada. Se calculan una vez por imagen y se reutilizan hasta que cambie.
         """
-        imagen_np = np.array(self.imagen_procesada)
-        
-        # Datos para el histograma de grises
-        imagen_gris_pil = self.imagen_procesada.convert('L')
-        datos_gris = np.array(imagen_gris_pil).flatten()
-        
-        # Datos para los canales RGB
-        datos_r = imagen_np[:, :, 0].flatten()
-        datos_g = imagen_np[:, :, 1].flatten()
-        datos_b = imagen_np[:, :, 2].flatten()
-        
-        # Devolvemos todo en un diccionario
-        return {
-            'gris': datos_gris,
-            'rojo': datos_r,
-            'verde': datos_g,
-            'azul': datos_b
-        }
+        if self._cache_histogramas is None or self._cache_histogramas[0] is not self.imagen_procesada:
+            self._cache_histogramas = (self.imagen_procesada, calcular_histogramas(np.asarray(self.imagen_procesada)))
+        return self._cache_histogramas[1]
+
+    @requiere_imagen
+    def _aplicar_con_histograma(self, funcion, **kwargs):
+        """Aplica en grises una función que puede reutilizar el histograma ya calculado."""
+        histograma = self._tomar_histogramas()['gris']
+        self._aplicar_transformacion(self.imagen_procesada, funcion, byn=True, histograma=histograma, **kwargs)
+
+    @requiere_imagen
+    def _aplicar_umbralizacion_iterativa(self):
+        resultado = umbral_iterativo(self._tomar_histogramas()['gris'])
+        print(f"Valor de umbral utilizado(T) = {resultado['umbral']} en {resultado['iteraciones']} iteraciones")
+        self._aplicar_transformacion(self.imagen_procesada, aplicar_umbralizacion, resultado['umbral'], byn=True)
 
     # ===========================((HERRAMIENTAS_GENERALES))==================================
 
@@ -437,7 +451,7 @@ class EditorDeImagenes:
     @requiere_imagen
     @refrescar_imagen
     def _escala_grises(self):
-        self.imagen_procesada = self.imagen_procesada.convert('L').convert('RGB')
+        self.imagen_procesada = self.imagen_procesada.convert('L')
     
     @requiere_imagen
     def _iniciar_resta(self):
@@ -445,17 +459,18 @@ class EditorDeImagenes:
         if not ruta_img2: return
 
         try:
-            img2 = Image.open(ruta_img2).convert("RGB")
+            img2 = self._convertir_modo_de_trabajo(Image.open(ruta_img2))
             if self.imagen_procesada.size != img2.size:
                 messagebox.showerror("Error de Dimensiones", "Las imágenes deben tener el mismo tamaño.")
                 return
             
-            imagen_np1 = np.array(self.imagen_procesada.convert('RGB')).astype(float)
-            imagen_np2 = np.array(img2.convert('RGB')).astype(float)
+            modo = 'L' if self.imagen_procesada.mode == img2.mode == 'L' else 'RGB'
+            imagen_np1 = a_tipo_de_calculo(np.array(self.imagen_procesada.convert(modo)))
+            imagen_np2 = a_tipo_de_calculo(np.array(img2.convert(modo)))
             
             resultado_np = restar_imagenes(imagen_np1, imagen_np2)
 
-            resultado = Image.fromarray(resultado_np.astype('uint8')).convert('RGB')
+            resultado = Image.fromarray(resultado_np.astype('uint8'))
             self._mostrar_ventana_resultado(resultado, "Resultado de la Resta")
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo cargar o procesar la imagen.\n{e}")
@@ -501,9 +516,22 @@ class EditorDeImagenes:
         except Exception as e:
             messagebox.showerror("Error al Leer RAW", f"No se pudo procesar el archivo RAW.\nError: {e}", parent=self.root)
 
+    def _convertir_modo_de_trabajo(self, imagen_pil: Image.Image) -> Image.Image:
+        """
+        Las imágenes grises (RAW, PGM, o RGB con los tres canales iguales) quedan en
+        modo 'L' y se procesan con un solo canal; el resto pasa a RGB.
+        """
+        if es_gris(imagen_pil.mode):
+            return imagen_pil.convert('L')
+        imagen_rgb = imagen_pil.convert('RGB')
+        if es_gris(imagen_rgb.mode, np.asarray(imagen_rgb)):
+            return imagen_rgb.convert('L')
+        return imagen_rgb
+
     @refrescar_imagen
     def _finalizar_carga_imagen(self, imagen_pil: Image.Image):
-        self.imagen_original = imagen_pil.convert("RGB")
+        liberar_buffers() # Los buffers de la imagen anterior ya no se van a reusar
+        self.imagen_original = self._convertir_modo_de_trabajo(imagen_pil)
         self.imagen_procesada = self.imagen_original.copy()
         self._ajustar_zoom_inicial()
 
@@ -518,8 +546,7 @@ class EditorDeImagenes:
 
     def _actualizar_display_imagenes(self):
         if not self.imagen_original: return
-        w, h = self.imagen_original.size
-        w_zoom, h_zoom = int(w * self.zoom_level), int(h * self.zoom_level)
+        w_zoom, h_zoom = self._tamano_en_pantalla()
         for canvas, pil_image in [(self.canvas_izquierdo, self.imagen_original), (self.canvas_derecho, self.imagen_procesada)]:
             if pil_image:
                 img_resized = pil_image.resize((w_zoom, h_zoom), Image.Resampling.LANCZOS)
@@ -529,6 +556,24 @@ class EditorDeImagenes:
                 canvas.image_ref = img_tk
                 canvas.config(scrollregion=(0, 0, w_zoom, h_zoom))
 
+    def _tamano_en_pantalla(self) -> Tuple[int, int]:
+        w, h = self.imagen_original.size
+        return int(w * self.zoom_level), int(h * self.zoom_level)
+
+    def _mostrar_vista_previa(self, imagen_pil: Image.Image):
+        """
+        Dibuja una vista previa (puede ser de menor resolución) en el visor derecho,
+        sin tocar la imagen procesada ni redibujar el visor izquierdo.
+        """
+        w_zoom, h_zoom = self._tamano_en_pantalla()
+        if imagen_pil.size != (w_zoom, h_zoom):
+            imagen_pil = imagen_pil.resize((w_zoom, h_zoom), Image.Resampling.BILINEAR)
+        img_tk = ImageTk.PhotoImage(imagen_pil)
+        self.canvas_derecho.delete("all")
+        self.canvas_derecho.create_image(0, 0, anchor="nw", image=img_tk)
+        self.canvas_derecho.image_ref = img_tk
+        self.canvas_derecho.config(scrollregion=(0, 0, w_zoom, h_zoom))
+
     def _ajustar_zoom_inicial(self):
         self.root.update_idletasks()
         canvas_w = self.canvas_izquierdo.winfo_width()
@@ -566,7 +611,15 @@ class EditorDeImagenes:
         try:
             r, g, b = (int(self.rgb_vars[c].get()) for c in self.CANALES_RGB)
             if not all(0 <= val <= 255 for val in (r, g, b)): return False
+            if self.imagen_procesada.mode == 'L':
+                if r == g == b:
+                    self.imagen_procesada.putpixel(self.pixel_seleccionado, r)
+                    self._cache_histogramas = None # La imagen cambió en el lugar
+                    self.color_preview.config(bg=f'#{r:02x}{g:02x}{b:02x}')
+                    return
+                self.imagen_procesada = self.imagen_procesada.convert('RGB') # Un color deja de ser gris
             self.imagen_procesada.putpixel(self.pixel_seleccionado, (r, g, b))
+            self._cache_histogramas = None
             self.color_preview.config(bg=f'#{r:02x}{g:02x}{b:02x}')
         except ValueError:
             return False
@@ -577,13 +630,17 @@ class EditorDeImagenes:
         img_y = int(self.canvas_derecho.canvasy(event.y) / self.zoom_level)
         w, h = self.imagen_procesada.size
         if 0 <= img_x < w and 0 <= img_y < h:
-            r, g, b = self.imagen_procesada.getpixel((img_x, img_y))
+            r, g, b = self._leer_pixel_rgb(img_x, img_y)
             self.color_preview.config(bg=f'#{r:02x}{g:02x}{b:02x}')
             if not self.pixel_seleccionado:
                 self.rgb_vars["R"].set(str(r))
                 self.rgb_vars["G"].set(str(g))
                 self.rgb_vars["B"].set(str(b))
 
+    def _leer_pixel_rgb(self, x: int, y: int) -> Tuple[int, int, int]:
+        valor = self.imagen_procesada.getpixel((x, y))
+        return (valor, valor, valor) if self.imagen_procesada.mode == 'L' else valor
+
     def _desactivar_modos(self):
         self.canvas_derecho.config(cursor="")
         self.canvas_derecho.unbind("<Button-1>")
@@ -599,7 +656,7 @@ class EditorDeImagenes:
         w, h = self.imagen_procesada.size
         if 0 <= img_x < w and 0 <= img_y < h:
             self.pixel_seleccionado = (img_x, img_y)
-            r, g, b = self.imagen_procesada.getpixel((img_x, img_y))
+            r, g, b = self._leer_pixel_rgb(img_x, img_y)
             self.rgb_vars["R"].set(str(r))
             self.rgb_vars["G"].set(str(g))
             self.rgb_vars["B"].set(str(b))
@@ -648,7 +705,7 @@ class EditorDeImagenes:
         recorte_pil = self.imagen_procesada.crop(box)
         
         # 2. Analiza la misma región recortada
-        pixeles = np.array(recorte_pil)
+        pixeles = np.array(recorte_pil.convert('RGB'))
         promedio_rgb = np.mean(pixeles, axis=(0, 1))
         r = int(promedio_rgb[0])
         g = int(promedio_rgb[1])
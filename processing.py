@@ -1,5 +1,12 @@
+import os
+import threading
+import multiprocessing
 import numpy as np
-from typing import Optional, Tuple, Callable
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections import OrderedDict
+from functools import lru_cache, partial, wraps
+from multiprocessing import shared_memory
+from typing import Optional, Tuple, Callable, List
 
 """
 Archivo con la lógica del procesamiento de las imágenes (solo trabaja con arrays de numpy)
@@ -7,117 +14,908 @@ Archivo con la lógica del procesamiento de las imágenes (solo trabaja con arra
 
 # =================================((FUNCIONES_ÚTILES))==================================
 
-def escalar_255(imagen_np: np.ndarray) -> np.ndarray:
+# Tipo en que se hacen las cuentas: para imágenes de 8 bits float32 alcanza y mueve la
+# mitad de memoria que float64. Las funciones que necesitan más lo piden con
+# tipo_de_calculo(np.float64). Las que reciben una imagen de punto flotante calculan en
+# su tipo (tipo=imagen.dtype): una imagen float64 se procesa en float64
+TIPO_DE_CALCULO = np.float32
+
+def tipo_de_calculo(precision_minima=None, tipo=None) -> np.dtype:
+    """
+    Devuelve tipo si es de punto flotante (si no TIPO_DE_CALCULO), o precision_minima
+    si este tiene más precisión.
+    """
+    base = np.dtype(tipo) if tipo is not None and np.issubdtype(tipo, np.floating) else np.dtype(TIPO_DE_CALCULO)
+    if precision_minima is None:
+        return base
+    return np.promote_types(base, precision_minima)
+
+def a_tipo_de_calculo(imagen_np: np.ndarray, precision_minima=None, out: Optional[np.ndarray] = None, tipo=None) -> np.ndarray:
+    """
+    Convierte la imagen al tipo de cálculo (sin copiar si ya lo es, o copiando en out).
+    """
+    if out is not None:
+        np.copyto(out, imagen_np, casting='unsafe')
+        return out
+    return np.asarray(imagen_np).astype(tipo_de_calculo(precision_minima, tipo), copy=False)
+
+# --- Buffers reutilizables
+
+# Arrays de trabajo que se guardan entre llamadas (por hilo) para no pedir memoria
+# nueva en cada tick de una vista previa. Son temporales: nunca se devuelven. Los
+# más grandes que MAXIMO_DE_BYTES_POR_BUFFER no se guardan (se liberan al terminar la
+# llamada) y entre todos los de un hilo no pasan de MAXIMO_DE_BYTES_EN_BUFFERS
+MAXIMO_DE_BYTES_POR_BUFFER = 32 * 2**20
+MAXIMO_DE_BYTES_EN_BUFFERS = 96 * 2**20
+_buffers_por_hilo = threading.local()
+
+def tomar_buffer(forma: Tuple[int, ...], tipo, nombre: str = "") -> np.ndarray:
+    """
+    Devuelve un array sin inicializar para (forma, tipo, nombre), el mismo en cada
+    llamada del mismo hilo mientras siga guardado. El nombre separa los buffers de
+    funciones que se llaman entre sí con la misma forma.
+    """
+    tipo = np.dtype(tipo)
+    if int(np.prod(forma)) * tipo.itemsize > MAXIMO_DE_BYTES_POR_BUFFER:
+        return np.empty(forma, dtype=tipo) # Temporal de una imagen grande: no se retiene
+
+    buffers = getattr(_buffers_por_hilo, 'buffers', None)
+    if buffers is None:
+        buffers = _buffers_por_hilo.buffers = OrderedDict()
+    clave = (tuple(forma), tipo, nombre)
+    if clave in buffers:
+        buffers.move_to_end(clave)
+        return buffers[clave]
+
+    buffer = buffers[clave] = np.empty(forma, dtype=tipo)
+    total = sum(b.nbytes for b in buffers.values())
+    while total > MAXIMO_DE_BYTES_EN_BUFFERS:
+        _, descartado = buffers.popitem(last=False) # Se descarta el usado hace más tiempo
+        total -= descartado.nbytes
+    return buffer
+
+def liberar_buffers():
+    """
+    Suelta los buffers guardados por el hilo actual (ej. al cerrar o cambiar de imagen).
+    """
+    _buffers_por_hilo.buffers = OrderedDict()
+
+def _escribir_en(out: Optional[np.ndarray], resultado: np.ndarray) -> np.ndarray:
+    if out is None:
+        return resultado
+    np.copyto(out, resultado, casting='unsafe')
+    return out
+
+def comparar_precision(funcion: Callable, imagen_np: np.ndarray, *args, tolerancia: float = 1, **kwargs) -> float:
+    """
+    Corre la función sobre la imagen en el tipo de cálculo y en float64 (el tipo viaja
+    con la imagen, no se toca TIPO_DE_CALCULO) y devuelve la mayor diferencia absoluta
+    entre los dos resultados. Si supera la tolerancia lanza ValueError.
+    """
+    tipo = tipo_de_calculo()
+    referencia = funcion(a_tipo_de_calculo(imagen_np, tipo=np.float64).copy(), *args, **kwargs)
+    resultado = funcion(a_tipo_de_calculo(imagen_np).copy(), *args, **kwargs)
+
+    diferencia = float(np.max(np.abs(np.asarray(resultado, dtype=np.float64) - np.asarray(referencia, dtype=np.float64))))
+    print(f"Diferencia máxima {tipo.name} vs float64: {diferencia}")
+    if not diferencia <= tolerancia: # También falla con NaN
+        raise ValueError(f"{getattr(funcion, '__name__', funcion)}: {tipo.name} difiere de float64 en {diferencia} (tolerancia {tolerancia})")
+    return diferencia
+
+# Modos de PIL que se trabajan con un solo canal
+MODOS_GRISES = ('1', 'L', 'LA', 'I', 'I;16', 'F')
+
+def es_gris(modo: str, imagen_rgb: Optional[np.ndarray] = None) -> bool:
+    """
+    Indica si una imagen se trabaja en escala de grises: por su modo de PIL o, si se
+    pasan sus píxeles ya en RGB, por tener los tres canales iguales.
+    """
+    if modo in MODOS_GRISES:
+        return True
+    if imagen_rgb is None:
+        return False
+    return np.array_equal(imagen_rgb[:, :, 0], imagen_rgb[:, :, 1]) and np.array_equal(imagen_rgb[:, :, 0], imagen_rgb[:, :, 2])
+
+def es_imagen_8_bits(imagen_np: np.ndarray) -> bool:
+    """
+    Indica si todos los valores son enteros en [0, 255] (aunque el array sea float).
+    """
+    if imagen_np.dtype == np.uint8:
+        return True
+    return bool(np.all((imagen_np >= 0) & (imagen_np <= 255) & (imagen_np == np.round(imagen_np))))
+
+def escalar_255(imagen_np: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
     """
     Escala linealmente un array de numpy al rango [0, 255].
+    Pura (out -> array uint8 donde escribir, puede ser la entrada si es uint8).
     """
+    if out is None:
+        out = np.empty(imagen_np.shape, dtype=np.uint8)
     min_val = np.min(imagen_np)
     max_val = np.max(imagen_np)
     if max_val == min_val:
-        return np.zeros_like(imagen_np, dtype=np.uint8)
-    array_normalizado = 255 * (imagen_np - min_val) / (max_val - min_val)
-    return array_normalizado.astype(np.uint8)
-
-def restar_imagenes(imagen_np1: np.ndarray, imagen_np2: np.ndarray) -> np.ndarray:
-    resultado_np = imagen_np1 - imagen_np2
+        out[...] = 0
+        return out
+    array_normalizado = tomar_buffer(imagen_np.shape, np.result_type(imagen_np.dtype, np.float32), "escalar_255")
+    np.subtract(imagen_np, min_val, out=array_normalizado)
+    np.multiply(array_normalizado, 255, out=array_normalizado)
+    np.divide(array_normalizado, max_val - min_val, out=array_normalizado)
+    np.copyto(out, array_normalizado, casting='unsafe')
+    return out
+
+def restar_imagenes(imagen_np1: np.ndarray, imagen_np2: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Pura (out -> array uint8 donde escribir).
+    """
+    resultado_np = np.subtract(imagen_np1, imagen_np2, out=tomar_buffer(imagen_np1.shape, np.result_type(imagen_np1, imagen_np2), "restar_imagenes"))
 
-    resultado_np = escalar_255(resultado_np)
+    resultado_np = escalar_255(resultado_np, out=out)
     return resultado_np
 
 # ===============================((OPERADORES_PUNTUALES))================================
 
-def aplicar_gamma(imagen_np: np.ndarray, gamma:float) -> np.ndarray:
+# --- Tablas de consulta (LUT)
+
+# Un operador puntual sobre uint8 es una tabla de 256 valores: se aplica con una sola
+# lectura por píxel y varios seguidos se componen en una única tabla
+NIVELES = np.arange(256)
+
+def lut_gamma(gamma: float) -> np.ndarray:
+    c = (255)**(1-gamma)
+    return (c*(NIVELES**gamma)).astype(np.uint8)
+
+def lut_umbralizacion(umbral: float) -> np.ndarray:
+    return np.where(NIVELES >= umbral, 255, 0).astype(np.uint8)
+
+def lut_negativo() -> np.ndarray:
+    return (255 - NIVELES).astype(np.uint8)
+
+def componer_luts(*luts: np.ndarray) -> np.ndarray:
+    """
+    Devuelve la tabla equivalente a aplicar las tablas en orden (la primera primero).
+    """
+    resultado = NIVELES.astype(np.uint8)
+    for lut in luts:
+        resultado = lut[resultado]
+    return resultado
+
+def aplicar_lut(imagen_np: np.ndarray, lut: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Pura (out -> array donde escribir, puede ser la entrada). La imagen debe ser uint8.
+    """
+    if out is None:
+        return lut[imagen_np]
+    return np.take(lut, imagen_np, out=out)
+
+def aplicar_cadena_puntual(imagen_np: np.ndarray, pasos: List, out: Optional[np.ndarray] = None, histograma: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Compone varios operadores puntuales y recorre la imagen una sola vez.
+    pasos -> tablas de 256 valores, o funciones histograma -> tabla para los que dependen
+             de la imagen (ej. lut_ecualizacion). El histograma se arrastra por las
+             tablas anteriores sin volver a leer la imagen.
+    histograma -> conteos de la imagen si ya se tienen (ej. de calcular_histogramas)
+    Pura (out -> array uint8 donde escribir).
+    """
+    niveles = imagen_np
+    if imagen_np.dtype != np.uint8:
+        niveles = tomar_buffer(imagen_np.shape, np.uint8, "aplicar_cadena_puntual")
+        np.copyto(niveles, imagen_np, casting='unsafe')
+
+    lut = NIVELES.astype(np.uint8)
+    for paso in pasos:
+        if callable(paso):
+            if histograma is None:
+                histograma = np.bincount(niveles.reshape(-1), minlength=256)
+            # Histograma de la imagen tal como quedaría después de la tabla acumulada
+            paso = paso(np.bincount(lut, weights=histograma, minlength=256))
+        lut = paso[lut]
+
+    return aplicar_lut(niveles, lut, out=out)
+
+# Las tres son puras; con out = imagen_np se aplican en el lugar.
+# Sobre uint8 usan su tabla; otros tipos se calculan píxel a píxel
+
+def aplicar_gamma(imagen_np: np.ndarray, gamma:float, out: Optional[np.ndarray] = None) -> np.ndarray:
+    if imagen_np.dtype == np.uint8:
+        return aplicar_lut(imagen_np, lut_gamma(gamma), out=out)
     c = (255)**(1-gamma)
-    resultado_np = c*(imagen_np**gamma)
+    resultado_np = np.power(imagen_np, gamma, out=out)
+    resultado_np *= c
 
     return resultado_np
 
-def aplicar_umbralizacion(imagen_np: np.ndarray, umbral:int) -> np.ndarray:
-    resultado_np = np.where(imagen_np >= umbral, 255, 0)
+def aplicar_umbralizacion(imagen_np: np.ndarray, umbral:int, out: Optional[np.ndarray] = None) -> np.ndarray:
+    if imagen_np.dtype == np.uint8:
+        return aplicar_lut(imagen_np, lut_umbralizacion(umbral), out=out)
+    if out is None:
+        out = np.empty(imagen_np.shape, dtype=np.uint8)
+    mascara = np.greater_equal(imagen_np, umbral, out=tomar_buffer(imagen_np.shape, bool, "aplicar_umbralizacion"))
+    resultado_np = np.multiply(mascara, np.uint8(255), out=out) # 255 donde supera el umbral, 0 si no
 
     return resultado_np
 
-def aplicar_negativo(imagen_np: np.ndarray) -> np.ndarray:
-    resultado_np = 255 - imagen_np
+def aplicar_negativo(imagen_np: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    if imagen_np.dtype == np.uint8:
+        return aplicar_lut(imagen_np, lut_negativo(), out=out)
+    resultado_np = np.subtract(255, imagen_np, out=out)
 
     return resultado_np
 
 # ================================((HISTOGRAMAS))========================================
 
-def aplicar_ecualizacion_histograma(imagen_np: np.ndarray) -> np.ndarray:
+# --- Conteos de gris y R/G/B
+
+def _niveles_de_gris(imagen_np: np.ndarray) -> np.ndarray:
+    """
+    Gris de una imagen RGB uint8 con la misma cuenta entera que PIL al convertir a 'L'.
+    """
+    r, g, b = (imagen_np[:, :, c].astype(np.uint32) for c in range(3))
+    return (r * 19595 + g * 38470 + b * 7471 + 0x8000) >> 16
+
+def calcular_histogramas(imagen_np: np.ndarray) -> dict:
+    """
+    Conteos absolutos (256 valores) de niveles de gris y de cada canal, todos con un
+    único bincount. En una imagen gris los tres canales son el mismo conteo.
+    """
+    if imagen_np.ndim == 2:
+        gris = np.bincount(imagen_np.reshape(-1), minlength=256)
+        return {'gris': gris, 'rojo': gris, 'verde': gris, 'azul': gris}
+
+    # Cada canal se corre 256 lugares: rojo en [0, 256), verde en [256, 512), ...
+    indices = tomar_buffer(imagen_np.shape[:2] + (4,), np.uint16, "calcular_histogramas")
+    np.add(imagen_np[:, :, :3], np.arange(0, 768, 256, dtype=np.uint16), out=indices[:, :, :3], casting='unsafe')
+    np.add(_niveles_de_gris(imagen_np), 768, out=indices[:, :, 3], casting='unsafe')
+    rojo, verde, azul, gris = np.bincount(indices.reshape(-1), minlength=1024).reshape(4, 256)
+    return {'gris': gris, 'rojo': rojo, 'verde': verde, 'azul': azul}
+
+def lut_ecualizacion(n_r: np.ndarray) -> np.ndarray:
+    """
+    Tabla de ecualización a partir del histograma absoluto (256 valores).
+    """
+    NM = np.sum(n_r) # Pixels totales(n)
+    sk = np.cumsum(n_r) / NM # Suma acumulada de las freq relativas (ni/n), sumando conteos enteros
+    sk_sombrero = escalar_255(sk) # Discretizamos
+    return sk_sombrero
+
+def aplicar_ecualizacion_histograma(imagen_np: np.ndarray, out: Optional[np.ndarray] = None, histograma: Optional[np.ndarray] = None) -> np.ndarray:
     """
     Realiza la ecualización del histograma.
+    histograma -> conteos ya calculados de la imagen (si no, se cuentan)
+    Pura (out -> array uint8 donde escribir, puede ser la misma entrada).
     """
-    imagen_np = imagen_np.astype(np.uint8)
-    datos_gris = imagen_np.flatten()
+    resultado_np = aplicar_cadena_puntual(imagen_np, [lut_ecualizacion], out=out, histograma=histograma) # Lookup table
 
-    n_r = np.bincount(datos_gris, minlength=256) # Freq abs(ni)
-    NM = datos_gris.size # Pixels totales(n)
-    h_r = n_r / NM # Freq relativa(ni/n)
+    return resultado_np
 
-    # Hacemos la suma acumulada
-    sk = np.zeros(256)
-    for k in range(len(sk)):
-        sk[k] = np.sum(h_r[0:k+1])
-    
-    sk_sombrero = escalar_255(sk) # Discretizamos
-    resultado_np = sk_sombrero[imagen_np] # Lookup table
+# --- Ecualización adaptativa (CLAHE)
+
+TESELAS_CLAHE = 8 # Teselas por lado
+LIMITE_CLAHE = 2.0 # Altura máxima de cada histograma, en múltiplos de la altura media
+
+def _tablas_clahe(niveles: np.ndarray, alto: int, ancho: int, limite: float) -> np.ndarray:
+    """
+    Tablas (filas de teselas, columnas de teselas, canales, 256) en float32. Los
+    histogramas de una fila de teselas salen de un único bincount.
+    """
+    m, n, c = niveles.shape
+    filas, columnas = -(-m // alto), -(-n // ancho)
+    tesela_de_columna = (np.arange(n) // ancho)[:, None] * c + np.arange(c) # (n, c)
+
+    histogramas = np.empty((filas, columnas * c, 256))
+    for i in range(filas):
+        banda = niveles[i*alto:(i+1)*alto]
+        indices = tesela_de_columna * 256 + banda
+        histogramas[i] = np.bincount(indices.reshape(-1), minlength=columnas * c * 256).reshape(-1, 256)
+
+    # Se recorta cada histograma y lo que sobra se reparte entre los 256 niveles
+    totales = histogramas.sum(axis=-1, keepdims=True)
+    techo = np.maximum(1.0, limite * totales / 256)
+    exceso = np.maximum(histogramas - techo, 0).sum(axis=-1, keepdims=True)
+    np.minimum(histogramas, techo, out=histogramas)
+    histogramas += exceso / 256
+
+    tablas = np.cumsum(histogramas, axis=-1) * (255 / totales)
+    return tablas.astype(np.float32).reshape(filas, columnas, c, 256)
+
+def _pesos_clahe(coordenadas: np.ndarray, tamano: int, cantidad: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Las dos teselas vecinas (por sus centros) de cada coordenada y el peso de la segunda.
+    """
+    posicion = (coordenadas + 0.5) / tamano - 0.5
+    primera = np.clip(np.floor(posicion), 0, cantidad - 1).astype(np.intp)
+    segunda = np.minimum(primera + 1, cantidad - 1)
+    peso = np.clip(posicion - primera, 0, 1).astype(np.float32)
+    return primera, segunda, peso
+
+def _interpolar_clahe(niveles: np.ndarray, tablas: np.ndarray, alto: int, ancho: int, filas: Tuple[int, int]) -> np.ndarray:
+    a, b = filas
+    cantidad_filas, cantidad_columnas, c, _ = tablas.shape
+    tablas_planas = tablas.reshape(-1)
+
+    y0, y1, wy = _pesos_clahe(np.arange(a, b), alto, cantidad_filas)
+    x0, x1, wx = _pesos_clahe(np.arange(niveles.shape[1]), ancho, cantidad_columnas)
+    y0, y1, wy = y0[:, None, None] * cantidad_columnas, y1[:, None, None] * cantidad_columnas, wy[:, None, None]
+    x0, x1, wx = x0[None, :, None], x1[None, :, None], wx[None, :, None]
+    nivel = np.arange(c) * 256 + niveles[a:b] # Posición dentro de las tablas de una tesela
+
+    def tabla(y, x):
+        return tablas_planas[(y + x) * (c * 256) + nivel]
+
+    arriba = tabla(y0, x0) * (1 - wx) + tabla(y0, x1) * wx
+    abajo = tabla(y1, x0) * (1 - wx) + tabla(y1, x1) * wx
+    return arriba * (1 - wy) + abajo * wy
+
+def aplicar_clahe(imagen_np: np.ndarray, teselas: int = TESELAS_CLAHE, limite: float = LIMITE_CLAHE, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Ecualización adaptativa con contraste limitado: cada tesela tiene su tabla de
+    ecualización (con el histograma recortado en limite) y cada píxel interpola
+    bilinealmente las tablas de las cuatro teselas cuyos centros lo rodean.
+    Cada canal se ecualiza por separado.
+    Pura (out -> array uint8 donde escribir).
+    """
+    niveles = tomar_buffer(imagen_np.shape, np.uint8, "aplicar_clahe")
+    np.copyto(niveles, imagen_np, casting='unsafe')
+    if niveles.ndim == 2:
+        niveles = niveles[:, :, None]
+    m, n, _ = niveles.shape
+    alto, ancho = max(1, -(-m // teselas)), max(1, -(-n // teselas))
+
+    tablas = _tablas_clahe(niveles, alto, ancho, limite)
+
+    resultado_np = out if out is not None else np.empty(imagen_np.shape, dtype=np.uint8)
+    resultado_3d = resultado_np[:, :, None] if resultado_np.ndim == 2 else resultado_np
+    def procesar(filas):
+        a, b = filas
+        np.copyto(resultado_3d[a:b], _interpolar_clahe(niveles, tablas, alto, ancho, filas) + 0.5, casting='unsafe')
+    paso = _tamano_tesela(m, n) # Bandas de filas del mismo alto que las teselas de los filtros
+    repartir(procesar, [(a, min(a + paso, m)) for a in range(0, m, paso)])
 
     return resultado_np
 
+
 # ===================================((RUIDO))===========================================
 
+# --- Semillas
+
+# Los números aleatorios se sacan por bloques fijos de la imagen, cada uno con su propio
+# flujo derivado de la semilla: el resultado no depende del orden ni de cuántos hilos
+# procesen los bloques
+TESELA_DE_RUIDO = 256
+
+def _secuencia_de_semillas(semilla) -> np.random.SeedSequence:
+    secuencia = semilla if isinstance(semilla, np.random.SeedSequence) else np.random.SeedSequence(semilla)
+    if semilla is None:
+        print(f"Semilla usada = {secuencia.entropy}") # Para poder repetir el resultado
+    return secuencia
+
+def _generador_de_bloque(secuencia: np.random.SeedSequence, i: int, j: int) -> np.random.Generator:
+    """Generador independiente del bloque (i, j) de TESELA_DE_RUIDO x TESELA_DE_RUIDO."""
+    return np.random.default_rng(np.random.SeedSequence(secuencia.entropy, spawn_key=secuencia.spawn_key + (i, j)))
+
 # --- Generar Vector Ruido (Gaussiano, Rayleigh, Exponencial)
 
-def generar_vector_ruido(distribucion, intensidad, cantidad) -> np.ndarray:
+def generar_vector_ruido(distribucion, intensidad, cantidad, generador: Optional[np.random.Generator] = None) -> np.ndarray:
     # distribucion = np.random.normal, np.random.rayleigh, np.random.exponential
+    # generador -> si se da, se usa su método del mismo nombre (ej. generador.normal)
+    if generador is not None:
+        distribucion = getattr(generador, distribucion.__name__)
     vector_aleatorio = distribucion(scale=intensidad, size=(cantidad, 1))
 
     return vector_aleatorio
 
 # -- Aditivo y Multiplicativo
 
-def aplicar_ruido(imagen_np: np.ndarray, tipo: str, vector_ruido: np.ndarray, d: int) -> np.ndarray:
+def cantidad_de_contaminados(forma: Tuple[int, ...], d: float) -> int:
+    m, n = forma[:2] # Los canales no cuentan: se contamina el píxel entero
+    return int((d * (m * n)) / 100)
+
+def aplicar_ruido(imagen_np: np.ndarray, tipo: str, vector_ruido: Optional[np.ndarray] = None, d: float = 20, out: Optional[np.ndarray] = None,
+                  distribucion=None, intensidad: Optional[float] = None, semilla=None) -> np.ndarray:
     """
     Aplica un vector de ruido a una imagen de forma aditiva o multiplicativa.
+    Los píxeles contaminados se eligen con tiempo y memoria proporcionales a su
+    cantidad (no se permuta toda la imagen).
+    vector_ruido -> un valor por píxel contaminado; si es None se genera acá con
+                    distribucion e intensidad (ver generar_vector_ruido)
+    semilla -> entero (o SeedSequence) para repetir el resultado; None usa una al azar
+    Pura: se contamina una copia de trabajo (out -> array uint8 donde escribir).
     """
-    #print("jeje, si anda el ruido")
-    m, n, _ = imagen_np.shape # Esto es para quedarme con 256 x 256 e ignorar los 3 canales rgb
+    m, n = imagen_np.shape[:2]
+    num_contaminados = cantidad_de_contaminados(imagen_np.shape, d)
 
-    # Cantidad de píxeles contaminados
-    num_contaminados = int((d * (m * n)) / 100)
-    # num_contaminados = len(vector_ruido)
-    D = np.unravel_index(np.random.choice(m * n, num_contaminados, replace=False),(m, n))
+    generador = np.random.default_rng(_secuencia_de_semillas(semilla))
+    # Sin reemplazo y sin mezclar: para densidades bajas numpy usa un conjunto de
+    # tamaño num_contaminados en vez de una permutación de los m*n índices
+    D = np.unravel_index(generador.choice(m * n, num_contaminados, replace=False, shuffle=False), (m, n))
+    if vector_ruido is None:
+        vector_ruido = generar_vector_ruido(distribucion, intensidad, num_contaminados, generador)
 
     # Generar la imagen contaminada I_c
-    if tipo == "Aditivo": imagen_np[D] += vector_ruido
-    elif tipo == "Multiplicativo": imagen_np[D] *= vector_ruido
+    contaminada = tomar_buffer(imagen_np.shape, np.result_type(imagen_np.dtype, np.float32), "aplicar_ruido")
+    np.copyto(contaminada, imagen_np)
+    vector_ruido = vector_ruido.reshape((-1,) + (1,) * (imagen_np.ndim - 2)) # Mismo ruido en todos los canales
+    if tipo == "Aditivo": contaminada[D] += vector_ruido
+    elif tipo == "Multiplicativo": contaminada[D] *= vector_ruido
     
-    resultado_np = escalar_255(imagen_np)
+    resultado_np = escalar_255(contaminada, out=out)
     
     return resultado_np
 
 # --- Sal y Pimienta
 
-def aplicar_ruido_sal_y_pimienta(imagen_np: np.ndarray, p: int) -> np.ndarray:
+def aplicar_ruido_sal_y_pimienta(imagen_np: np.ndarray, p: float, out: Optional[np.ndarray] = None, semilla=None, hilos: Optional[int] = None) -> np.ndarray:
+    """
+    Cada píxel pasa a 0 con probabilidad p y a 255 con probabilidad p (en todos sus canales).
+    semilla -> entero (o SeedSequence) para repetir el resultado; None usa una al azar
+    Pura: contamina una copia (out -> array donde escribir, con out = imagen_np es en el lugar).
+    """
+    m, n = imagen_np.shape[:2]
+    resultado_np = _escribir_en(out, imagen_np) if out is not None else imagen_np.copy()
+    secuencia = _secuencia_de_semillas(semilla)
+
+    def contaminar(bloque):
+        a, b, c, d = bloque
+        x = _generador_de_bloque(secuencia, a // TESELA_DE_RUIDO, c // TESELA_DE_RUIDO).random((b - a, d - c))
+        region = resultado_np[a:b, c:d]
+        region[x <= p] = 0 # pimienta (negro)
+        region[x > (1-p)] = 255 # sal (blanco)
 
-    m, n, _ = imagen_np.shape
+    repartir(contaminar, _teselas(0, m, 0, n, TESELA_DE_RUIDO), hilos)
 
-    for i in range(m):
-        for j in range(n):
-            x = np.random.rand()
-            if x <= p:
-                imagen_np[i, j, :] = 0 # pimienta (negro)
-            elif x > (1-p):
-                imagen_np[i, j, :] = 255 # sal (blanco)
+    return resultado_np
+
+
+# ===================================((BORDES))==========================================
+
+MODOS_DE_BORDE = ('constant', 'reflect', 'replicate', 'wrap')
+
+def _indices_borde(indices: np.ndarray, n: int, borde: str) -> np.ndarray:
+    """
+    Lleva índices fuera de [0, n) a la posición de la imagen que les corresponde
+    según el modo de borde ('constant' deja los de afuera como están).
+    """
+    if borde == 'replicate': # aaa|abcd|ddd
+        return np.clip(indices, 0, n - 1)
+    if borde == 'wrap': # bcd|abcd|abc
+        return indices % n
+    if borde == 'reflect': # dcb|abcd|cba (sin repetir el píxel del borde)
+        if n == 1:
+            return np.zeros_like(indices)
+        periodo = 2 * (n - 1)
+        indices = indices % periodo
+        return np.where(indices >= n, periodo - indices, indices)
+    if borde == 'constant':
+        return indices
+    raise ValueError(f"Modo de borde desconocido: {borde} (usar uno de {MODOS_DE_BORDE})")
+
+def extraer_region(imagen_np: np.ndarray, filas: Tuple[int, int], columnas: Tuple[int, int], borde: str = 'constant') -> np.ndarray:
+    """
+    Devuelve la región [r0, r1) x [c0, c1) de la imagen, que puede salirse de ella.
+    Si cae entera dentro es una vista (sin copia); si no, solo se arma esa región
+    completando lo de afuera según el modo de borde ('constant' completa con ceros).
+    """
+    (r0, r1), (c0, c1) = filas, columnas
+    m, n = imagen_np.shape[:2]
+    if r0 >= 0 and c0 >= 0 and r1 <= m and c1 <= n:
+        return imagen_np[r0:r1, c0:c1]
+
+    if borde == 'constant':
+        region = np.zeros((r1 - r0, c1 - c0) + imagen_np.shape[2:], dtype=imagen_np.dtype)
+        a, b = max(r0, 0), min(r1, m)
+        c, d = max(c0, 0), min(c1, n)
+        if a < b and c < d:
+            region[a-r0:b-r0, c-c0:d-c0] = imagen_np[a:b, c:d]
+        return region
+
+    filas_origen = _indices_borde(np.arange(r0, r1), m, borde)
+    columnas_origen = _indices_borde(np.arange(c0, c1), n, borde)
+    return imagen_np[np.ix_(filas_origen, columnas_origen)]
+
+# Hilos entre los que se reparten teselas y canales: numpy libera el GIL en las
+# operaciones sobre arrays grandes, así que escalan con los núcleos. 1 -> todo en el
+# hilo que llama
+CANTIDAD_DE_HILOS = os.cpu_count() or 1
+
+_ejecutores = {}
+_hilo_trabajador = threading.local()
+
+def _trabajar(funcion: Callable, tarea):
+    _hilo_trabajador.activo = True # Lo que se reparta desde acá corre en este mismo hilo
+    return funcion(tarea)
+
+def repartir(funcion: Callable, tareas, hilos: Optional[int] = None) -> list:
+    """
+    Aplica funcion a cada tarea repartiéndolas en un pool de hilos (que se crea una
+    vez por cantidad de hilos y se reutiliza) y devuelve los resultados en orden.
+    Dentro de un hilo del pool las tareas se hacen en el mismo hilo, así no se
+    bloquea esperando a otras tareas del mismo pool.
+    """
+    tareas = list(tareas)
+    hilos = CANTIDAD_DE_HILOS if hilos is None else hilos
+    if hilos <= 1 or len(tareas) <= 1 or getattr(_hilo_trabajador, 'activo', False):
+        return [funcion(tarea) for tarea in tareas]
+
+    if hilos not in _ejecutores:
+        _ejecutores[hilos] = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="procesamiento")
+    return list(_ejecutores[hilos].map(lambda tarea: _trabajar(funcion, tarea), tareas))
+
+# Lado (en píxeles de salida) de las teselas en que se recorren los operadores de
+# vecindario: los temporales de cada tesela entran en caché y la memoria extra no
+# depende del tamaño de la imagen. 0 -> sin teselas (cada región entera). Se lee en
+# cada llamada a través de _tamano_tesela
+TAMANO_TESELA = 128
+
+def _tamano_tesela(m: int, n: int, tamano: Optional[int] = None) -> int:
+    """
+    Lado efectivo de las teselas para una región de m x n: tamano (None ->
+    TAMANO_TESELA), o una sola tesela con toda la región si es 0.
+    """
+    if tamano is None:
+        tamano = TAMANO_TESELA
+    return tamano if tamano else max(m, n, 1)
+
+def _teselas(a: int, b: int, c: int, d: int, tamano: int):
+    for i in range(a, b, tamano):
+        for j in range(c, d, tamano):
+            yield (i, min(i + tamano, b), j, min(j + tamano, d))
+
+def aplicar_con_bordes(imagen_np: np.ndarray, k: int, l: int, operador: Callable, borde: str = 'constant', tamano_tesela: Optional[int] = None, hilos: Optional[int] = None) -> np.ndarray:
+    """
+    Aplica un operador de vecindario de k x l resolviendo el borde solo en el halo.
+
+    operador(entrada, forma) recibe una región de la imagen con su halo y devuelve la
+    salida de tamaño forma = (alto, ancho), donde la salida (i, j) depende de
+    entrada[i:i+k, j:j+l]. El interior se procesa directamente sobre la imagen
+    original (sin copia con padding) y solo las cuatro franjas del borde, de k//2 y
+    l//2 píxeles, se arman con extraer_region.
+
+    Cada región se recorre en teselas de tamano_tesela x tamano_tesela (None ->
+    TAMANO_TESELA, 0 -> sin teselas) que se solapan en el halo. Si el operador
+    calcula cada píxel de salida solo con su vecindario, el resultado es idéntico
+    bit a bit al de procesar la imagen entera. Las teselas se reparten entre hilos
+    (por defecto CANTIDAD_DE_HILOS) y cada una escribe su parte de la salida.
+    """
+    m, n = imagen_np.shape[:2]
+    tamano_tesela = _tamano_tesela(m, n, tamano_tesela)
+    pad_h, pad_w = k//2, l//2
+    alto, ancho = m - k + 1, n - l + 1 # Salidas cuyo vecindario cae entero dentro de la imagen
+
+    if alto <= 0 or ancho <= 0: # Imagen más chica que la máscara: todo es borde
+        rectangulos = [(0, m, 0, n)]
+    else:
+        fin_h, fin_w = pad_h + alto, pad_w + ancho
+        rectangulos = [(pad_h, fin_h, pad_w, fin_w), # Interior
+                       (0, pad_h, 0, n), (fin_h, m, 0, n), # Franjas de arriba y de abajo
+                       (pad_h, fin_h, 0, pad_w), (pad_h, fin_h, fin_w, n)] # Franjas de los costados
+
+    def procesar(tesela):
+        a, b, c, d = tesela
+        entrada = extraer_region(imagen_np, (a - pad_h, b - pad_h + k - 1), (c - pad_w, d - pad_w + l - 1), borde)
+        return operador(entrada, (b - a, d - c))
+
+    def procesar_y_guardar(tesela):
+        a, b, c, d = tesela
+        resultado[a:b, c:d] = procesar(tesela) # Las teselas no se pisan: cada hilo escribe la suya
+
+    teselas = [tesela for rectangulo in rectangulos for tesela in _teselas(*rectangulo, tamano_tesela) if tesela[0] < tesela[1] and tesela[2] < tesela[3]]
+    primera = procesar(teselas[0]) # Define la forma y el tipo de la salida
+    resultado = np.empty((m, n) + primera.shape[2:], dtype=primera.dtype)
+    a, b, c, d = teselas[0]
+    resultado[a:b, c:d] = primera
+    del primera
+
+    repartir(procesar_y_guardar, teselas[1:], hilos)
+    return resultado
+
+# ============================((EJECUCIÓN EN PROCESOS))==================================
+
+# Para operadores cuyo costo está en el intérprete (los hilos no los aceleran): las
+# imágenes van en memoria compartida y cada proceso resuelve una banda de filas
+
+# Los trabajadores no se crean con fork: para entonces el proceso ya tiene los hilos
+# de repartir (y los de Tk), y un hijo de fork puede quedar trabado en un lock que
+# tenía otro hilo. forkserver (o spawn donde no existe) arranca procesos limpios
+METODO_DE_INICIO = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+_pools_de_procesos = {}
+
+def _pool_de_procesos(procesos: int) -> ProcessPoolExecutor:
+    if procesos not in _pools_de_procesos:
+        contexto = multiprocessing.get_context(METODO_DE_INICIO)
+        _pools_de_procesos[procesos] = ProcessPoolExecutor(max_workers=procesos, mp_context=contexto)
+    return _pools_de_procesos[procesos]
+
+def crear_compartido(forma: Tuple[int, ...], tipo) -> Tuple[shared_memory.SharedMemory, np.ndarray]:
+    """
+    Bloque de memoria compartida nuevo y el array (forma, tipo) que lo usa. Quien lo
+    crea tiene que cerrarlo y liberarlo (close y unlink).
+    """
+    memoria = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(forma)) * np.dtype(tipo).itemsize))
+    return memoria, np.ndarray(forma, dtype=tipo, buffer=memoria.buf)
+
+def _procesar_banda(entrada: tuple, salida: tuple, filas: Tuple[int, int], k: int, l: int, operador: Callable, borde: str, fijar_marco: bool, tamano_tesela: int):
+    """
+    Corre en el proceso trabajador: entrada y salida son (nombre, forma, tipo) de
+    bloques de memoria compartida y solo se escriben las filas [a, b) de la salida,
+    recorriéndolas por teselas de tamano_tesela (ya resuelto en el proceso principal).
+    """
+    memoria_entrada = shared_memory.SharedMemory(name=entrada[0])
+    memoria_salida = shared_memory.SharedMemory(name=salida[0])
+    try:
+        imagen = np.ndarray(entrada[1], dtype=entrada[2], buffer=memoria_entrada.buf)
+        resultado = np.ndarray(salida[1], dtype=salida[2], buffer=memoria_salida.buf)
+        a, b = filas
+        m, n = imagen.shape[:2]
+        pad_h, pad_w = k//2, l//2
+        for i0, i1, j0, j1 in _teselas(a, b, 0, n, tamano_tesela):
+            region = extraer_region(imagen, (i0 - pad_h, i1 - pad_h + k - 1), (j0 - pad_w, j1 - pad_w + l - 1), borde)
+            resultado[i0:i1, j0:j1] = operador(region, (i1 - i0, j1 - j0))
+            del region
+        if fijar_marco: # El marco exterior de un píxel queda como en la entrada
+            resultado[a:b, [0, -1]] = imagen[a:b, [0, -1]]
+            if a == 0: resultado[0] = imagen[0]
+            if b == m: resultado[m - 1] = imagen[m - 1]
+        del imagen, resultado # Sin vistas vivas para poder cerrar la memoria
+    finally:
+        memoria_entrada.close()
+        memoria_salida.close()
+
+def aplicar_en_procesos(imagen_np: np.ndarray, k: int, l: int, operador: Callable, procesos: int, borde: str = 'constant', iteraciones: int = 1, fijar_marco: bool = False) -> np.ndarray:
+    """
+    Como aplicar_con_bordes pero repartiendo bandas de filas (con su halo) entre
+    procesos. La entrada y la salida están en memoria compartida, así que no se
+    serializan; el operador sí, por eso tiene que ser una función del módulo (o un
+    functools.partial de una) y devolver valores del tipo de cálculo.
+
+    Con iteraciones > 1 la salida de cada paso es la entrada del siguiente: se
+    espera a que terminen todas las bandas y se intercambian los dos buffers.
+    fijar_marco = True -> el marco exterior de un píxel se copia de la entrada en
+    cada paso (como en la difusión).
+    """
+    m, n = imagen_np.shape[:2]
+    tamano_tesela = _tamano_tesela(m, n)
+    limites = np.linspace(0, m, min(procesos, m) + 1).astype(int)
+    bandas = [(a, b) for a, b in zip(limites[:-1], limites[1:]) if a < b]
+
+    memoria_a, actual = crear_compartido(imagen_np.shape, tipo_de_calculo(tipo=imagen_np.dtype))
+    memoria_b, siguiente = crear_compartido(imagen_np.shape, tipo_de_calculo(tipo=imagen_np.dtype))
+    try:
+        actual[:] = imagen_np
+        pool = _pool_de_procesos(procesos)
+        for _ in range(iteraciones):
+            entrada = (memoria_a.name, actual.shape, actual.dtype)
+            salida = (memoria_b.name, siguiente.shape, siguiente.dtype)
+            tareas = [pool.submit(_procesar_banda, entrada, salida, banda, k, l, operador, borde, fijar_marco, tamano_tesela) for banda in bandas]
+            for tarea in tareas:
+                tarea.result() # Sincronización entre pasos (y propaga los errores)
+            memoria_a, memoria_b = memoria_b, memoria_a
+            actual, siguiente = siguiente, actual
+        resultado = actual.copy()
+    finally:
+        del actual, siguiente
+        for memoria in (memoria_a, memoria_b):
+            memoria.close()
+            memoria.unlink()
+
+    return resultado
+
+# ============================((MOTOR DE CONVOLUCIÓN))===================================
+
+def descomponer_filtro(filtro: np.ndarray) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Si la máscara es separable (rango 1) devuelve (columna, fila) tales que
+    filtro = columna ⊗ fila, si no devuelve None.
+
+    Se toma como pivote el valor de mayor módulo, así las máscaras enteras
+    (Sobel, Prewitt, media) se descomponen sin error de redondeo.
+    """
+    filtro = np.asarray(filtro, dtype=float)
+    i, j = np.unravel_index(np.argmax(np.abs(filtro)), filtro.shape)
+    if filtro[i, j] == 0:
+        return None
+
+    columna = filtro[:, j].copy()
+    fila = filtro[i, :] / filtro[i, j]
+
+    if not np.allclose(np.outer(columna, fila), filtro, rtol=1e-12, atol=1e-12 * abs(filtro[i, j])):
+        return None
+    return (columna, fila)
+
+def _acumular_desplazamientos(imagen_padded: np.ndarray, filtro: np.ndarray, forma: Tuple[int, int]) -> np.ndarray:
+    """
+    Suma la imagen desplazada una vez por cada posición de la máscara.
+    'forma' es el tamaño (alto, ancho) de la salida.
+    """
+    m, n = forma
+    resultado = np.zeros((m, n) + imagen_padded.shape[2:], dtype=tipo_de_calculo(tipo=imagen_padded.dtype))
+    auxiliar = np.empty_like(resultado)
+    filtro = filtro.astype(resultado.dtype, copy=False) # Pesos del mismo tipo: no se promueve a float64
+
+    for (u, v), peso in np.ndenumerate(filtro):
+        if peso == 0: continue # Las posiciones nulas (Sobel, Prewitt) no aportan
+        np.multiply(imagen_padded[u:u+m, v:v+n], peso, out=auxiliar)
+        resultado += auxiliar
+
+    return resultado
+
+def _longitud_rapida(n: int) -> int:
+    """
+    Menor longitud >= n que solo tiene factores 2, 3 y 5 (la FFT es más rápida así).
+    """
+    while True:
+        resto = n
+        for p in (2, 3, 5):
+            while resto % p == 0:
+                resto //= p
+        if resto == 1:
+            return n
+        n += 1
+
+def _correlacionar_fft_region(entrada: np.ndarray, filtro: np.ndarray, forma: Tuple[int, int]) -> np.ndarray:
+    """
+    Correlación de una región que ya trae su halo, en el dominio de la frecuencia (rfft2).
+    Alcanza con rellenar hasta el tamaño de la entrada: lo que se pliega por el efecto
+    circular cae en las primeras k-1 filas y l-1 columnas, que se descartan.
+    """
+    m, n = forma
+    k, l = filtro.shape
+    H, W = _longitud_rapida(entrada.shape[0]), _longitud_rapida(entrada.shape[1])
+
+    # Correlacionar es convolucionar con la máscara invertida
+    espectro_filtro = np.fft.rfft2(filtro[::-1, ::-1], s=(H, W))
+    espectro_filtro = espectro_filtro.reshape(espectro_filtro.shape + (1,) * (entrada.ndim - 2))
+    espectro_imagen = np.fft.rfft2(entrada, s=(H, W), axes=(0, 1))
+    espectro_imagen *= espectro_filtro
+
+    completa = np.fft.irfft2(espectro_imagen, s=(H, W), axes=(0, 1))
+    resultado = completa[k-1:k-1+m, l-1:l-1+n]
+
+    # Máscara e imagen enteras dan resultado entero: se redondea el error de la FFT
+    # para que el truncado a uint8 coincida con el camino directo
+    if np.all(filtro == np.round(filtro)) and np.all(entrada == np.round(entrada)):
+        resultado = np.round(resultado)
+    return resultado
 
-    return imagen_np
+def tamano_tesela_fft(m: int, n: int, k: int, l: int) -> int:
+    """
+    Lado de las teselas de salida para la FFT (solapar y descartar) sobre una imagen
+    de m x n: cada tesela con su halo mide una longitud rápida de al menos el doble de
+    la tesela general y 4 veces la máscara, así el halo repetido es una fracción
+    chica del trabajo. Sin teselas (TAMANO_TESELA = 0) es la imagen entera.
+    """
+    tesela = _tamano_tesela(m, n)
+    if tesela >= max(m, n):
+        return tesela
+    halo = max(k, l) - 1
+    return _longitud_rapida(max(2 * tesela, 4 * (halo + 1))) - halo
+
+def correlacionar_fft(imagen_np: np.ndarray, filtro: np.ndarray, borde: str = 'constant') -> np.ndarray:
+    """
+    Misma operación que el camino directo pero en el dominio de la frecuencia (rfft2),
+    por teselas que se solapan en el halo (solapar y descartar): la memoria temporal
+    es la de una tesela y no la de toda la imagen. Con máscara e imagen enteras el
+    resultado se redondea y no depende de la grilla; si no, puede diferir del camino
+    directo en el error de redondeo de la FFT.
+    """
+    k, l = filtro.shape
+    return aplicar_con_bordes(imagen_np, k, l, lambda entrada, forma: _correlacionar_fft_region(entrada, filtro, forma), borde,
+                              tamano_tesela=tamano_tesela_fft(*imagen_np.shape[:2], k, l))
+
+def _sumar_ventanas(entrada: np.ndarray, k: int, l: int, forma: Tuple[int, int]) -> np.ndarray:
+    m, n = forma
+    # Necesita float64: las sumas acumuladas crecen con el área y en float32 se pierden unidades
+    integral = np.zeros((entrada.shape[0] + 1, entrada.shape[1] + 1) + entrada.shape[2:], dtype=tipo_de_calculo(np.float64)) # Fila y columna extra de ceros
+    integral[1:, 1:] = entrada
+    np.cumsum(integral, axis=0, out=integral)
+    np.cumsum(integral, axis=1, out=integral)
+
+    resultado = integral[k:k+m, l:l+n] - integral[0:m, l:l+n]
+    resultado -= integral[k:k+m, 0:n]
+    resultado += integral[0:m, 0:n]
+    return resultado.astype(tipo_de_calculo(tipo=entrada.dtype), copy=False) # Cada suma ya es chica
+
+def correlacionar_integral(imagen_np: np.ndarray, k: int, l: int, borde: str = 'constant') -> np.ndarray:
+    """
+    Suma de cada ventana de k x l usando la imagen integral (tabla de áreas sumadas).
+    Cada ventana se resuelve con 4 accesos, así que el costo por píxel no depende del
+    tamaño de la máscara. Se arma una integral por tesela (con su halo): con píxeles
+    enteros las sumas en float64 son exactas y el resultado no depende de la grilla.
+    """
+    return aplicar_con_bordes(imagen_np, k, l, lambda entrada, forma: _sumar_ventanas(entrada, k, l, forma), borde)
+
+# Costo relativo (por elemento y por log2 del tamaño) de la FFT frente a una pasada
+# de desplazamiento y acumulación, medido con numpy sobre imágenes de 512x512
+COSTO_RELATIVO_FFT = 1.2
+# Costo relativo por elemento de la imagen integral (dos cumsum y tres restas), medido igual
+COSTO_RELATIVO_INTEGRAL = 4
+
+def elegir_metodo_correlacion(forma_imagen: Tuple[int, ...], filtro: np.ndarray, separable: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> str:
+    """
+    Estima el costo de cada camino y devuelve 'directo', 'separable', 'fft' o
+    'integral' (este último solo para máscaras constantes, como la de la media).
+    """
+    m, n = forma_imagen[:2]
+    k, l = filtro.shape
+
+    costos = {'directo': np.count_nonzero(filtro) * m * n}
+    if separable is not None:
+        columna, fila = separable
+        costos['separable'] = np.count_nonzero(fila) * (m + k - 1) * n + np.count_nonzero(columna) * m * n
+    if np.all(filtro == filtro.flat[0]):
+        costos['integral'] = COSTO_RELATIVO_INTEGRAL * (m + k) * (n + l)
+    tesela = tamano_tesela_fft(m, n, k, l)
+    alto, ancho = min(tesela, m), min(tesela, n)
+    H, W = _longitud_rapida(alto + k - 1), _longitud_rapida(ancho + l - 1) # Tesela con su halo
+    teselas = -(-m // alto) * -(-n // ancho)
+    costos['fft'] = COSTO_RELATIVO_FFT * teselas * H * W * np.log2(H * W)
+
+    return min(costos, key=costos.get)
+
+def correlacionar(imagen_np: np.ndarray, filtro: np.ndarray, metodo: Optional[str] = None, borde: str = 'constant') -> np.ndarray:
+    """
+    Pasa la máscara sobre la imagen y devuelve la suma ponderada de cada vecindario,
+    para todos los canales a la vez.
+
+    En lugar de recorrer píxel por píxel se acumula la imagen desplazada una vez por
+    cada posición de la máscara, así el costo es k*l operaciones sobre arrays enteros.
+    Si la máscara es separable se hacen dos pasadas 1D (filas y columnas) y el costo
+    baja a k+l. Para máscaras grandes se usa la FFT y para las constantes (media)
+    la imagen integral.
 
+    metodo = None -> elige 'directo', 'separable', 'fft' o 'integral' según el costo estimado
+    borde -> 'constant' (ceros), 'reflect', 'replicate' o 'wrap'
+    """
+    k, l = filtro.shape
+
+    separable = descomponer_filtro(filtro) if min(k, l) > 1 else None
+    if metodo is None:
+        metodo = elegir_metodo_correlacion(imagen_np.shape, filtro, separable)
+    if metodo == 'fft':
+        tipo = tipo_de_calculo(tipo=imagen_np.dtype)
+        return correlacionar_fft(imagen_np.astype(tipo, copy=False), filtro.astype(tipo, copy=False), borde)
+    if metodo == 'integral':
+        resultado = correlacionar_integral(imagen_np, k, l, borde)
+        resultado *= filtro.flat[0]
+        return resultado
+
+    # Los caminos directo y separable se recorren por teselas (la conversión al tipo de
+    # cálculo también se hace por tesela, al multiplicar)
+    if metodo == 'directo' or separable is None:
+        return aplicar_con_bordes(imagen_np, k, l, lambda entrada, forma: _acumular_desplazamientos(entrada, filtro, forma), borde)
+
+    columna, fila = separable
+    def operador(entrada, forma):
+        parcial = _acumular_desplazamientos(entrada, fila[np.newaxis, :], (entrada.shape[0], forma[1])) # Pasada horizontal
+        return _acumular_desplazamientos(parcial, columna[:, np.newaxis], forma) # Pasada vertical
+    return aplicar_con_bordes(imagen_np, k, l, operador, borde)
 
 # ===================================((FILTROS))=========================================
 
+# --- Caché de máscaras
+
+TAMANO_CACHE_FILTROS = 64 # Cantidad de máscaras (fábrica, k/sigma) que se guardan entre llamadas
+
+@lru_cache(maxsize=TAMANO_CACHE_FILTROS)
+def _filtro_en_cache(func_filtro: Callable, k: int) -> Tuple[np.ndarray, float]:
+    filtro, factor = func_filtro(k)
+    filtro = np.array(filtro) # Copia propia, así nadie conserva una referencia escribible
+    filtro.setflags(write=False)
+    return (filtro, factor)
+
+def cachear_filtro(func_filtro: Callable) -> Callable:
+    """
+    Decorador para las fábricas de máscaras: la máscara de cada (fábrica, k/sigma) se
+    construye una sola vez y se guarda en un LRU acotado. La máscara devuelta es de
+    solo lectura (copiarla antes de modificarla).
+    """
+    @wraps(func_filtro)
+    def envoltura(k: int) -> Tuple[np.ndarray, float]:
+        return _filtro_en_cache(func_filtro, k)
+    return envoltura
+
 # --- Media
 
+@cachear_filtro
 def crear_filtro_media(k: int) -> Tuple[np.ndarray, float]:
     filtro = np.ones((k, k))
 
@@ -125,31 +923,251 @@ def crear_filtro_media(k: int) -> Tuple[np.ndarray, float]:
     return (filtro, factor)
 
 # --- Mediana
+@cachear_filtro
 def crear_filtro_mediana(k: int) -> Tuple[np.ndarray, float]:
     filtro = np.ones((k, k)).astype(int)
     factor = 1
     return (filtro, factor)
 
+def mediana_por_histograma(imagen_np: np.ndarray, k: int, l: int, borde: str = 'constant') -> np.ndarray:
+    """
+    Mediana de cada ventana de k x l para imágenes de 8 bits, con histogramas
+    deslizantes al estilo Perreault-Hébert.
+
+    Cada columna tiene su histograma de k filas y al bajar una fila solo cambia un
+    valor por columna. El histograma de cada ventana es la diferencia de dos sumas
+    acumuladas de columnas, y la mediana se busca primero en 16 niveles gruesos y
+    después en los 16 finos de ese nivel. El costo por píxel no depende de k.
+    """
+    return aplicar_con_bordes(imagen_np, k, l, lambda entrada, forma: _mediana_por_histograma_region(entrada, k, l, forma), borde)
+
+def _mediana_por_histograma_region(entrada: np.ndarray, k: int, l: int, forma: Tuple[int, int]) -> np.ndarray:
+    m, n = forma
+    valores = entrada.astype(np.intp).reshape(entrada.shape[0], entrada.shape[1], -1)
+    _, W, C = valores.shape
+    tipo = np.uint16 if k * l < 2**16 else np.uint32 # Aritmética modular: alcanza con que entre k*l
+    NIVELES = 256 + 16 # 256 niveles finos y 16 gruesos (de a 16 niveles) en el mismo histograma
+
+    # Histograma de cada columna sobre k filas, se actualiza al bajar una fila
+    columnas = np.zeros((W, C, NIVELES), dtype=tipo)
+    plano_columnas = columnas.reshape(-1)
+    origen = (np.arange(W)[:, np.newaxis] * C + np.arange(C)) * NIVELES
+    for u in range(k - 1):
+        plano_columnas[origen + valores[u]] += 1
+        plano_columnas[origen + 256 + (valores[u] >> 4)] += 1
+
+    # Se procesan B filas de salida juntas para que la suma a lo largo de las columnas
+    # se haga con pocas llamadas sobre arrays grandes
+    B = max(1, min(m, 2**22 // (W * C * NIVELES)))
+    bloque = np.empty((W, B, C, NIVELES), dtype=tipo)
+    acumulado = np.zeros((W + 1, B, C, NIVELES), dtype=tipo)
+    plano = acumulado.reshape(-1)
+    salto = l * B * C * NIVELES
+    base = ((np.arange(n)[:, np.newaxis, np.newaxis] * B + np.arange(B)[:, np.newaxis]) * C + np.arange(C)) * NIVELES
+    finos = np.arange(16)
+    rangos = sorted({(k*l - 1)//2, k*l//2}) # Con k*l par la mediana promedia los dos centrales
+    resultado = np.empty((m, n, C), dtype=tipo_de_calculo(tipo=entrada.dtype))
+
+    for i0 in range(0, m, B):
+        b = min(B, m - i0)
+        for r in range(b):
+            i = i0 + r
+            if i > 0:
+                plano_columnas[origen + valores[i - 1]] -= 1
+                plano_columnas[origen + 256 + (valores[i - 1] >> 4)] -= 1
+            plano_columnas[origen + valores[i + k - 1]] += 1
+            plano_columnas[origen + 256 + (valores[i + k - 1] >> 4)] += 1
+            bloque[:, r] = columnas
+
+        for j in range(W):
+            np.add(acumulado[j, :b], bloque[j, :b], out=acumulado[j + 1, :b])
+
+        # Histograma grueso de cada ventana (diferencia de acumulados) y su acumulada
+        gruesa = acumulado[l:l+n, :b, :, 256:] - acumulado[:n, :b, :, 256:]
+        np.cumsum(gruesa, axis=-1, dtype=tipo, out=gruesa)
+
+        mediana = 0
+        for rango in rangos:
+            debajo_rango = gruesa <= rango
+            nivel = np.count_nonzero(debajo_rango, axis=-1) # Nivel grueso donde cae la mediana
+            debajo = np.max(gruesa * debajo_rango, axis=-1) # Cantidad de valores antes de ese nivel
+
+            indices = (base[:, :b] + nivel * 16)[..., np.newaxis] + finos
+            fina = plano.take(indices + salto) - plano.take(indices)
+            np.cumsum(fina, axis=-1, dtype=tipo, out=fina)
+            fina += debajo[..., np.newaxis]
+            mediana = mediana + nivel * 16 + np.count_nonzero(fina <= rango, axis=-1)
+
+        resultado[i0:i0+b] = (mediana / len(rangos)).transpose(1, 0, 2)
+
+    return resultado.reshape(forma + entrada.shape[2:])
+
 # --- Mediana Ponderada
 
+@cachear_filtro
 def crear_filtro_mediana_ponderada(k: int) -> Tuple[np.ndarray, float]:
-    filtro_gauss, _ = crear_filtro_gaussiano(k)
-    filtro = (filtro_gauss * 50).astype(int)
+    filtro, _ = crear_filtro_gaussiano(k) # Los pesos se usan tal cual (no hace falta que sean enteros)
 
     factor = 1
     return (filtro, factor)
 
+def _mediana_ponderada_ordenando(valores: np.ndarray, pesos: np.ndarray, ocho_bits: bool) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Ordena los valores de cada ventana (último eje) y devuelve (ordenados, pesos acumulados).
+    """
+    K = pesos.size
+    if ocho_bits:
+        # Valor y posición en una sola clave entera: ordenar enteros es más rápido que argsort
+        clave = valores.astype(np.int32) * K + np.arange(K, dtype=np.int32)
+        clave.sort(axis=-1)
+        ordenados, orden = np.divmod(clave, K)
+    else:
+        orden = np.argsort(valores, axis=-1)
+        ordenados = np.take_along_axis(valores, orden, axis=-1)
+    return ordenados, np.cumsum(pesos[orden], axis=-1)
+
+# Por debajo de esta cantidad de pesos no nulos conviene ordenar cada ventana, por encima
+# sumar los pesos en histogramas de 256 niveles (medido en imágenes de 512x512)
+PESOS_MAXIMOS_ORDENANDO = 40
+
+def mediana_ponderada(imagen_np: np.ndarray, pesos: np.ndarray, borde: str = 'constant') -> np.ndarray:
+    """
+    Mediana ponderada de cada ventana con pesos reales.
+
+    Es el valor donde el peso acumulado de los valores ordenados llega a la mitad del
+    peso total; si cae justo en la mitad se promedian los dos valores (igual que
+    np.median repitiendo cada valor según su peso entero). Se procesa por bloques de
+    filas: ordenando cada ventana, o para imágenes de 8 bits y máscaras grandes,
+    sumando los pesos en histogramas. Si la máscara es separable (como la gaussiana)
+    se arma un histograma acumulado por columna con los pesos verticales y la mitad
+    se busca en 8 pasos de búsqueda binaria, cada uno combinando l columnas con los
+    pesos horizontales: el costo por píxel crece con k + l y no con k * l.
+    """
+    k, l = pesos.shape
+    ocho_bits = es_imagen_8_bits(imagen_np)
+    separable = None
+    if ocho_bits and np.count_nonzero(pesos) > PESOS_MAXIMOS_ORDENANDO:
+        separable = descomponer_filtro(pesos)
+    if separable is not None:
+        columna, fila = separable
+        return aplicar_con_bordes(imagen_np, k, l, lambda entrada, forma: _mediana_ponderada_separable_region(entrada, columna, fila, forma), borde)
+    return aplicar_con_bordes(imagen_np, k, l, lambda entrada, forma: _mediana_ponderada_region(entrada, pesos, ocho_bits, forma), borde)
+
+def _mediana_ponderada_separable_region(entrada: np.ndarray, columna: np.ndarray, fila: np.ndarray, forma: Tuple[int, int]) -> np.ndarray:
+    m, n = forma
+    valores = entrada.astype(np.intp).reshape(entrada.shape[0], entrada.shape[1], -1)
+    _, W, C = valores.shape
+    l = fila.size
+    mitad = np.sum(np.outer(columna, fila)) / 2
+
+    # Histograma acumulado de cada columna con los pesos de columna (peso de los valores
+    # <= t), por bloques de filas de salida. El nivel es el primer eje (cada nivel es
+    # un bloque contiguo que se suma al siguiente) y las columnas el último (las l
+    # columnas de una ventana quedan contiguas). En float64: la mitad exacta del peso
+    # total decide los empates
+    filas = max(1, min(m, 2**20 // (W * C * 256)))
+    acumulados = np.empty((256, filas, C, W), dtype=np.float64)
+    plano = acumulados.reshape(-1)
+    base = (np.arange(filas)[:, np.newaxis, np.newaxis] * C + np.arange(C)) * W + np.arange(W)[:, np.newaxis] # (filas, W, C)
+    salto = filas * C * W # Un nivel más en el histograma plano
+    indice_fila = np.arange(filas)[:, np.newaxis, np.newaxis]
+    indice_columna = np.arange(n)[:, np.newaxis]
+    indice_canal = np.arange(C)
+
+    resultado = np.empty((m, n, C), dtype=tipo_de_calculo(tipo=entrada.dtype))
+    for i0 in range(0, m, filas):
+        b = min(filas, m - i0)
+        acumulados[:] = 0
+        for u, peso in enumerate(columna):
+            if peso != 0:
+                np.add.at(plano, base[:b] + valores[i0+u:i0+u+b] * salto, peso)
+        for t in range(1, 256): # Más rápido que np.cumsum sobre el primer eje
+            np.add(acumulados[t], acumulados[t - 1], out=acumulados[t])
+        ventanas = np.lib.stride_tricks.sliding_window_view(acumulados, l, axis=-1) # (256, filas, C, n, l)
+
+        def peso_hasta(t):
+            """Peso de los valores <= t en cada ventana (t por píxel)."""
+            return ventanas[t, indice_fila[:b], indice_canal, indice_columna].reshape(-1, l) @ fila
+
+        # Búsqueda binaria del primer nivel donde el peso acumulado llega a la mitad
+        # (inferior) y del primero donde la supera (superior, distinto solo si hay empate)
+        extremos = []
+        for comparar in (np.less, np.less_equal):
+            nivel = np.zeros((b, n, C), dtype=np.intp)
+            for paso in (128, 64, 32, 16, 8, 4, 2, 1):
+                nivel += paso * comparar(peso_hasta(nivel + paso - 1), mitad).reshape(b, n, C)
+            extremos.append(np.minimum(nivel, 255))
+            if comparar is np.less and not np.any(peso_hasta(extremos[0]) == mitad):
+                extremos.append(extremos[0]) # Sin empates: los dos extremos coinciden
+                break
+        inferior, superior = extremos
+        resultado[i0:i0+b] = (inferior + superior) / 2
+
+    return resultado.reshape(forma + entrada.shape[2:])
+
+def _mediana_ponderada_region(entrada: np.ndarray, pesos: np.ndarray, ocho_bits: bool, forma: Tuple[int, int]) -> np.ndarray:
+    m, n = forma
+    imagen_padded = entrada.reshape(entrada.shape[0], entrada.shape[1], -1)
+    C = imagen_padded.shape[2]
+
+    pesos = np.asarray(pesos, dtype=float)
+    mitad = pesos.sum() / 2
+    desplazamientos = np.argwhere(pesos != 0) # Los pesos nulos no aportan
+    pesos = pesos[pesos != 0]
+    K = pesos.size
+
+    por_histograma = ocho_bits and K > PESOS_MAXIMOS_ORDENANDO
+    if por_histograma:
+        imagen_padded = imagen_padded.astype(np.intp)
+        filas = max(1, 2**21 // (n * C * 256))
+        # Pesos acumulados en float64: la mitad exacta del peso total decide los empates
+        histograma = np.zeros(filas * n * C * 256, dtype=np.float64)
+        base = np.arange(filas * n * C).reshape(filas, n, C) * 256
+        finos = np.arange(16)
+    else:
+        filas = max(1, 2**22 // (n * C * K))
+
+    resultado = np.empty((m, n, C), dtype=tipo_de_calculo(tipo=entrada.dtype))
+    for i0 in range(0, m, filas):
+        b = min(filas, m - i0)
+        if por_histograma:
+            histograma[:] = 0
+            for (u, v), peso in zip(desplazamientos, pesos):
+                np.add.at(histograma, base[:b] + imagen_padded[i0+u:i0+u+b, v:v+n], peso)
+
+            # Búsqueda en 16 niveles gruesos y después en los 16 finos del nivel elegido
+            gruesa = np.cumsum(histograma[:b*n*C*256].reshape(b, n, C, 16, 16) @ np.ones(16), axis=-1)
+            extremos = []
+            for comparar in (np.less, np.less_equal):
+                antes = comparar(gruesa, mitad)
+                nivel = np.minimum(np.count_nonzero(antes, axis=-1), 15)
+                debajo = np.max(gruesa * antes, axis=-1) # Peso de los niveles gruesos anteriores
+                fina = np.cumsum(histograma.take((base[:b] + nivel * 16)[..., np.newaxis] + finos), axis=-1)
+                fina += debajo[..., np.newaxis]
+                extremos.append(nivel * 16 + np.minimum(np.count_nonzero(comparar(fina, mitad), axis=-1), 15))
+            inferior, superior = extremos
+        else:
+            valores = np.stack([imagen_padded[i0+u:i0+u+b, v:v+n] for u, v in desplazamientos], axis=-1)
+            ordenados, acumulado = _mediana_ponderada_ordenando(valores, pesos, ocho_bits)
+            posicion = np.count_nonzero(acumulado < mitad, axis=-1)[..., np.newaxis]
+            inferior = np.take_along_axis(ordenados, posicion, axis=-1)[..., 0]
+            posicion = np.minimum(np.count_nonzero(acumulado <= mitad, axis=-1), K - 1)[..., np.newaxis]
+            superior = np.take_along_axis(ordenados, posicion, axis=-1)[..., 0]
+        resultado[i0:i0+b] = (inferior + superior) / 2
+
+    return resultado.reshape(forma + entrada.shape[2:])
+
 # --- Gaussiano
 
+@cachear_filtro
 def crear_filtro_gaussiano(sigma: int) -> Tuple[np.ndarray, float]:
     k = 2 * sigma + 1
-    filtro = np.ones((k, k)).astype(float)
     u = k // 2 # Centro donde el valor debe ser máximo (son iguales ya que es cuadrada)
     #sigma = (k-1) / 2
 
-    for x in range(k):
-        for y in range(k):
-            filtro[x, y] = (1 / (2 * np.pi * sigma**2)) * np.exp(-((x - u)**2 + (y - u)**2)/(sigma**2))
+    x, y = np.ogrid[:k, :k]
+    distancia = (x - u)**2 + (y - u)**2 # Se arma toda la máscara por broadcasting
+    filtro = (1 / (2 * np.pi * sigma**2)) * np.exp(-distancia/(sigma**2))
 
     factor = 1 / np.sum(filtro)
     #print(f"Factor usado: {1} / {np.sum(filtro)}")
@@ -157,6 +1175,7 @@ def crear_filtro_gaussiano(sigma: int) -> Tuple[np.ndarray, float]:
 
 # --- Realce de Bordes
 
+@cachear_filtro
 def crear_filtro_realce(k: int) -> Tuple[np.ndarray, float]:
     filtro = -1 * np.ones((k, k))
     filtro[k//2, k//2] = k**2 - 1
@@ -166,6 +1185,7 @@ def crear_filtro_realce(k: int) -> Tuple[np.ndarray, float]:
 
 # --- Realce de Bordes Prewitt
 
+@cachear_filtro
 def crear_filtro_prewitt_x(k: int) -> Tuple[np.ndarray, float]:
     filtro = np.array([[-1, -1, -1],
                         [0, 0, 0],
@@ -173,6 +1193,7 @@ def crear_filtro_prewitt_x(k: int) -> Tuple[np.ndarray, float]:
     factor = 1 # usar 1 / 9
     return (filtro, factor)
 
+@cachear_filtro
 def crear_filtro_prewitt_y(k: int) -> Tuple[np.ndarray, float]:
     filtro = np.array([[-1, 0, 1],
                         [-1, 0, 1],
@@ -182,6 +1203,7 @@ def crear_filtro_prewitt_y(k: int) -> Tuple[np.ndarray, float]:
 
 # --- Realce de Bordes Sobel
 
+@cachear_filtro
 def crear_filtro_sobel_x(k: int) -> Tuple[np.ndarray, float]:
     filtro = np.array([[-1, -2, -1],
                         [0, 0, 0],
@@ -189,6 +1211,7 @@ def crear_filtro_sobel_x(k: int) -> Tuple[np.ndarray, float]:
     factor = 1
     return (filtro, factor)
 
+@cachear_filtro
 def crear_filtro_sobel_y(k: int) -> Tuple[np.ndarray, float]:
     filtro = np.array([[-1, 0, 1],
                         [-2, 0, 2],
@@ -196,69 +1219,127 @@ def crear_filtro_sobel_y(k: int) -> Tuple[np.ndarray, float]:
     factor = 1
     return (filtro, factor)
 
-def aplicar_filtro(imagen_np: np.ndarray, func_filtro, k=3, modo=0, mediana=False) -> np.ndarray:
+def aplicar_filtro(imagen_np: np.ndarray, func_filtro, k=3, modo=0, mediana=False, borde='constant', out: Optional[np.ndarray] = None) -> np.ndarray:
     """
     Convoluciona una máscara con la matriz de la imagen
-    
+
     modo = 0 -> escala el resultado a 255,
     modo = 1 -> clipea el resultado,
     modo = 2 -> no transforma el resultado
 
     mediana = True -> aplica la mediana
+
+    borde -> cómo se completa fuera de la imagen: 'constant' (ceros), 'reflect',
+             'replicate' o 'wrap'
+
+    Pura (out -> array donde escribir el resultado).
     """
     filtro, factor = func_filtro(k)
     print("Filtro usado:")
     print(filtro)
     print(f"Factor usado: {factor}")
-    m, n, _ = imagen_np.shape
     k, l = filtro.shape
-    pad_h, pad_w = k//2, l//2
-
-    # Padding e imagen filtrada
-    imagen_padded = np.pad(imagen_np, ((pad_h, pad_h), (pad_w, pad_w), (0, 0)), mode='constant')
-    imagen_filtrada = np.zeros_like(imagen_np)
 
-    indices_repeticion = filtro.flatten().astype(int) # Solo para mediana
-
-    # Bucle para filtrado (c para los canales)
-    for i in range(m):
-        for j in range(n):
-            for c in range(3):
-                region = imagen_padded[i:i+k, j:j+l, c]
-                if not mediana:
-                    valor = np.sum(region * filtro) * factor
-                else:
-                    valores = np.repeat(region.flatten(), indices_repeticion) # Indica cuantas veces se repite cada indice
-                    valor = np.median(valores) # Mediana
-                imagen_filtrada[i, j, c] = valor
+    if not mediana:
+        imagen_filtrada = correlacionar(imagen_np, filtro, borde=borde)
+        if factor != 1: imagen_filtrada *= factor # En el lugar: no se promueve a float64
+    elif np.all(filtro == filtro.flat[0]) and es_imagen_8_bits(imagen_np):
+        imagen_filtrada = mediana_por_histograma(imagen_np, k, l, borde)
+    else:
+        imagen_filtrada = mediana_ponderada(imagen_np, filtro, borde)
+    imagen_filtrada = imagen_filtrada.astype(imagen_np.dtype, copy=False)
 
     if modo == 0:
-        resultado_np = escalar_255(imagen_filtrada)
+        resultado_np = escalar_255(imagen_filtrada, out=out)
         print("modo 0")
     elif modo == 1:
-        resultado_np = np.clip(imagen_filtrada, 0, 255).astype(np.uint8)
+        np.clip(imagen_filtrada, 0, 255, out=imagen_filtrada) # imagen_filtrada ya es un array nuevo
+        resultado_np = _escribir_en(out, imagen_filtrada) if out is not None else imagen_filtrada.astype(np.uint8)
         print("modo 1")
     elif modo == 2:
-        resultado_np = imagen_filtrada
+        resultado_np = _escribir_en(out, imagen_filtrada)
         print("modo 2")
 
     return resultado_np
 
-def aplicar_filtro_combinado(imagen_np: np.ndarray, func_filtro1, func_filtro2) -> np.ndarray:
+def calcular_gradiente(imagen_np: np.ndarray, func_filtro_x=crear_filtro_sobel_x, func_filtro_y=crear_filtro_sobel_y, orientacion: bool = False, borde: str = 'constant') -> dict:
     """
-    Aplica dos filtros (x e y) y combina sus resultados.
+    Calcula en un solo recorrido las derivadas con las dos máscaras, el módulo del
+    gradiente y (opcional) la orientación cuantizada en 0, 45, 90 y 135 grados.
+
+    Las dos máscaras comparten el padding y cada desplazamiento de la imagen se lee
+    una sola vez para ambas. Si las dos son separables (Sobel, Prewitt) se hacen las
+    pasadas 1D, compartiendo las que coinciden.
     """
-    img1 = aplicar_filtro(imagen_np, func_filtro=func_filtro1, modo=2)
-    img2 = aplicar_filtro(imagen_np, func_filtro=func_filtro2, modo=2)
+    filtro_x, factor_x = func_filtro_x(3)
+    filtro_y, factor_y = func_filtro_y(3)
+    print("Filtros usados:")
+    print(filtro_x)
+    print(filtro_y)
+    k, l = filtro_x.shape
+    separable_x = descomponer_filtro(filtro_x)
+    separable_y = descomponer_filtro(filtro_y)
+
+    derivadas = aplicar_con_bordes(imagen_np, k, l,
+                                   lambda entrada, forma: _derivadas_region(entrada, filtro_x, filtro_y, separable_x, separable_y, forma), borde)
+    gx, gy = derivadas[..., 0], derivadas[..., 1]
+
+    if factor_x != 1: gx *= factor_x
+    if factor_y != 1: gy *= factor_y
 
-    imagen_filtrada = np.sqrt((img1**2)+(img2**2))
+    gradiente = {'gx': gx, 'gy': gy, 'magnitud': np.hypot(gx, gy)}
+
+    if orientacion:
+        angulo = np.degrees(np.arctan2(gy, gx)) % 180
+        gradiente['orientacion'] = ((np.floor((angulo + 22.5) / 45) % 4) * 45).astype(np.uint8)
+
+    return gradiente
+
+def _derivadas_region(imagen_padded: np.ndarray, filtro_x: np.ndarray, filtro_y: np.ndarray, separable_x, separable_y, forma: Tuple[int, int]) -> np.ndarray:
+    """
+    Las dos correlaciones de una región con su halo, apiladas en el último eje.
+    """
+    m, n = forma
+    if separable_x is not None and separable_y is not None:
+        (columna_x, fila_x), (columna_y, fila_y) = separable_x, separable_y
+        parcial_x = _acumular_desplazamientos(imagen_padded, fila_x[np.newaxis, :], (imagen_padded.shape[0], n)) # Pasadas horizontales
+        if np.array_equal(fila_x, fila_y):
+            parcial_y = parcial_x
+        else:
+            parcial_y = _acumular_desplazamientos(imagen_padded, fila_y[np.newaxis, :], (imagen_padded.shape[0], n))
+        gx = _acumular_desplazamientos(parcial_x, columna_x[:, np.newaxis], (m, n)) # Pasadas verticales
+        gy = _acumular_desplazamientos(parcial_y, columna_y[:, np.newaxis], (m, n))
+    else:
+        gx = np.zeros(imagen_padded[:m, :n].shape, dtype=tipo_de_calculo(tipo=imagen_padded.dtype))
+        gy = np.zeros_like(gx)
+        auxiliar = np.empty_like(gx)
+        for (u, v), peso_x in np.ndenumerate(filtro_x):
+            peso_y = filtro_y[u, v]
+            if peso_x == 0 and peso_y == 0: continue
+            desplazada = imagen_padded[u:u+m, v:v+n]
+            if peso_x != 0:
+                np.multiply(desplazada, peso_x, out=auxiliar)
+                gx += auxiliar
+            if peso_y != 0:
+                np.multiply(desplazada, peso_y, out=auxiliar)
+                gy += auxiliar
+
+    return np.stack((gx, gy), axis=-1)
+
+def aplicar_filtro_combinado(imagen_np: np.ndarray, func_filtro1, func_filtro2, borde: str = 'constant', out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Aplica dos filtros (x e y) y combina sus resultados.
+    Pura (out -> array uint8 donde escribir).
+    """
+    imagen_filtrada = calcular_gradiente(imagen_np, func_filtro1, func_filtro2, borde=borde)['magnitud']
 
-    resultado_np = escalar_255(imagen_filtrada)
+    resultado_np = escalar_255(imagen_filtrada, out=out)
 
     return resultado_np
 
 # ============================((MÉTODO DEL LAPLACIANO))==================================
 
+@cachear_filtro
 def crear_filtro_laplace(k: int) -> Tuple[np.ndarray, float]:
     filtro = np.array([[0, -1, 0],
                         [-1, 4, -1],
@@ -266,15 +1347,15 @@ def crear_filtro_laplace(k: int) -> Tuple[np.ndarray, float]:
     factor = 1
     return (filtro, factor)
 
+@cachear_filtro
 def crear_filtro_log(sigma: int) -> Tuple[np.ndarray, float]:
     k = 4 * sigma + 1
-    filtro = np.ones((k, k)).astype(float)
     u = k // 2 # Centro donde el valor debe ser máximo (son iguales ya que es cuadrada)
     #sigma = (k-1) / 2
 
-    for x in range(k):
-        for y in range(k):
-            filtro[x, y] = (1 / (2 * np.pi * sigma**3)) * np.exp(-((x - u)**2 + (y - u)**2)/(2 * sigma**2)) * (((x - u)**2 + (y - u)**2)/(sigma**2) - 2)
+    x, y = np.ogrid[:k, :k]
+    distancia = (x - u)**2 + (y - u)**2 # Se arma toda la máscara por broadcasting
+    filtro = (1 / (2 * np.pi * sigma**3)) * np.exp(-distancia/(2 * sigma**2)) * (distancia/(sigma**2) - 2)
 
     factor = 1 #/ np.sum(filtro)
     #print(f"Factor usado: {1} / {np.sum(filtro)}")
@@ -322,16 +1403,36 @@ def encontrar_cruces_por_cero_pendiente_vectorizado(imagen_np: np.ndarray, umbra
 
     return imagen_filtrada
 
-def aplicar_metodo_del_laplaciano(imagen_np: np.ndarray, log: bool = False, pendiente: bool = False, umbral: int = 50, sigma: int = 1) -> np.ndarray:
-    if not log:
-        img = aplicar_filtro(imagen_np, func_filtro=crear_filtro_laplace, modo=2)
+def _cruces_region(entrada: np.ndarray, forma: Tuple[int, int], pendiente: bool, umbral) -> np.ndarray:
+    m, n = forma
+    actual, siguiente = entrada[:, 1:n+1], entrada[:, 2:n+2] # La ventana es de 1 x 3 centrada en (i, j)
+    if pendiente:
+        cruce = (np.abs(actual) + np.abs(siguiente)) > umbral
     else:
-        img = aplicar_filtro(imagen_np, func_filtro=crear_filtro_log, k=sigma, modo=2)
-    if not pendiente:
-        img = encontrar_cruces_por_cero(img)
+        cruce = (actual * siguiente) < 0
+    if cruce.ndim == 3:
+        cruce = np.any(cruce, axis=2, keepdims=True) # Si cruza en un canal se marca el píxel entero
+    return np.broadcast_to(np.where(cruce, 255, 0).astype(entrada.dtype), entrada[:, 1:n+1].shape)
+
+def encontrar_cruces_por_cero_teselado(imagen_np: np.ndarray, pendiente: bool = False, umbral=128) -> np.ndarray:
+    """
+    Igual que encontrar_cruces_por_cero (o la versión con pendiente) pero vectorizado
+    y recorrido por teselas: si cruza en algún canal se marca el píxel en todos.
+    """
+    imagen_filtrada = aplicar_con_bordes(imagen_np, 1, 3, lambda entrada, forma: _cruces_region(entrada, forma, pendiente, umbral))
+    imagen_filtrada[:, -1] = 0 # La última columna no tiene vecino a la derecha
+    return imagen_filtrada
+
+def aplicar_metodo_del_laplaciano(imagen_np: np.ndarray, log: bool = False, pendiente: bool = False, umbral: int = 50, sigma: int = 1, borde: str = 'constant', out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Pura (out -> array donde escribir la imagen binaria).
+    """
+    if not log:
+        img = aplicar_filtro(imagen_np, func_filtro=crear_filtro_laplace, modo=2, borde=borde)
     else:
-        img = encontrar_cruces_por_cero_pendiente(img, umbral=umbral)
-    return img
+        img = aplicar_filtro(imagen_np, func_filtro=crear_filtro_log, k=sigma, modo=2, borde=borde)
+    img = encontrar_cruces_por_cero_teselado(img, pendiente=pendiente, umbral=umbral)
+    return _escribir_en(out, img)
 
 # ==============================((FILTRO DE DIFUSIÓN))===================================
 
@@ -345,142 +1446,290 @@ def detector_de_lorentz(gradiente, sigma:int):
 
 # --- Difusión ---
 
-def aplicar_filtro_difusion(imagen_np: np.ndarray, t: float, sigma: int, isotropico: bool = False, lamb: float = 0.25) -> np.ndarray:
-    m, n, _ = imagen_np.shape
-    imagen_filtrada = imagen_np.copy()
+def _paso_difusion_region(entrada: np.ndarray, forma: Tuple[int, int], sigma: int, isotropico: bool, lamb: float) -> np.ndarray:
+    m, n = forma
+    centro = entrada[1:m+1, 1:n+1]
+
+    # Gradientes
+    DN = entrada[1:m+1, 2:n+2] - centro
+    DE = entrada[0:m, 1:n+1] - centro
+    DO = entrada[2:m+2, 1:n+1] - centro
+    DS = entrada[1:m+1, 0:n] - centro
+
+    # Actualización (los coeficientes valen 1 en el caso isotrópico)
+    if isotropico:
+        return centro + lamb * (DN + DE + DO + DS)
+    return centro + lamb * (DN * detector_de_leclerc(DN, sigma) + DE * detector_de_leclerc(DE, sigma) +
+                            DO * detector_de_leclerc(DO, sigma) + DS * detector_de_leclerc(DS, sigma))
+
+def aplicar_filtro_difusion(imagen_np: np.ndarray, t: float, sigma: int, isotropico: bool = False, lamb: float = 0.25, procesos: int = 0, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Cada paso actualiza todos los píxeles a partir de la imagen del paso anterior
+    (esquema explícito), recorriendo por teselas. El marco exterior de un píxel no
+    se modifica.
+
+    procesos > 0 -> reparte bandas de filas entre esa cantidad de procesos con
+                    memoria compartida, sincronizando entre pasos
+
+    Pura (out -> array uint8 donde escribir).
+    """
+    paso = partial(_paso_difusion_region, sigma=sigma, isotropico=isotropico, lamb=lamb)
+    if procesos > 0:
+        imagen_filtrada = aplicar_en_procesos(imagen_np, 3, 3, paso, procesos, iteraciones=t, fijar_marco=True)
+        return escalar_255(imagen_filtrada, out=out)
+
+    imagen_filtrada = a_tipo_de_calculo(imagen_np, tipo=imagen_np.dtype)
 
     for _ in range(t):
-        for i in range(1, m - 1):
-            for j in range(1, n - 1):
-                for c in range(3):
-
-                    # Gradientes
-                    DN = imagen_filtrada[i, j + 1, c] - imagen_filtrada[i, j, c]
-                    DE = imagen_filtrada[i - 1, j, c] - imagen_filtrada[i, j, c]
-                    DO = imagen_filtrada[i + 1, j, c] - imagen_filtrada[i, j, c]
-                    DS = imagen_filtrada[i, j - 1, c] - imagen_filtrada[i, j, c]
-                    
-                    # Coeficientes
-                    if isotropico:
-                        cN = cE = cO = cS = 1
-                    else:
-                        cN = detector_de_leclerc(DN, sigma)
-                        cE = detector_de_leclerc(DE, sigma)
-                        cO = detector_de_leclerc(DO, sigma)
-                        cS = detector_de_leclerc(DS, sigma)
-
-                    # Actualización
-                    imagen_filtrada[i, j, c] += lamb * (DN * cN + DE * cE + DO * cO + DS * cS)
+        siguiente = aplicar_con_bordes(imagen_filtrada, 3, 3, paso)
+        siguiente[[0, -1]] = imagen_filtrada[[0, -1]]
+        siguiente[:, [0, -1]] = imagen_filtrada[:, [0, -1]]
+        imagen_filtrada = siguiente
     
-    resultado_np = escalar_255(imagen_filtrada)
+    resultado_np = escalar_255(imagen_filtrada, out=out)
     return resultado_np
 
 # ===============================((FILTRO BILATERAL))====================================
 
-def aplicar_filtro_bilateral(imagen_np: np.ndarray, sigma_s: int = 1, sigma_r: int = 1) -> np.ndarray:
+def aplicar_filtro_bilateral(imagen_np: np.ndarray, sigma_s: int = 1, sigma_r: int = 1, borde: str = 'constant', procesos: int = 0, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    procesos > 0 -> reparte bandas de filas entre esa cantidad de procesos con memoria compartida
 
+    Pura (out -> array uint8 donde escribir).
+    """
     Gs, factor = crear_filtro_gaussiano(sigma_s)
     print("Filtro espacial usado:")
     print(Gs)
-    m, n, _ = imagen_np.shape
     k, l = Gs.shape
-    pad_h, pad_w = k//2, l//2
-
-    # Padding e imagen filtrada
-    imagen_padded = np.pad(imagen_np, ((pad_h, pad_h), (pad_w, pad_w), (0, 0)), mode='constant')
-    imagen_filtrada = np.zeros_like(imagen_np)
 
-    for i in range(m):
-        for j in range(n):
-            region = imagen_padded[i:i+k, j:j+l, :]
+    operador = partial(_filtro_bilateral_region, Gs=Gs, sigma_r=sigma_r)
+    if procesos > 0:
+        imagen_filtrada = aplicar_en_procesos(imagen_np, k, l, operador, procesos, borde)
+    else:
+        imagen_filtrada = aplicar_con_bordes(imagen_np, k, l, operador, borde)
+    imagen_filtrada = imagen_filtrada.astype(imagen_np.dtype, copy=False)
 
-            dif = region - region[pad_h, pad_w, :]
-            #print(f"Shape de dif: {dif.shape}")
-            Gr = np.exp(-(np.sum(dif**2, axis=2) / (2 * sigma_r**2)))
-            #print(f"Shape de Gr: {Gr.shape}")
+    resultado_np = escalar_255(imagen_filtrada, out=out)
+    return resultado_np
 
-            Wx = np.sum(Gs * Gr)
+def _filtro_bilateral_region(imagen_padded: np.ndarray, forma: Tuple[int, int], Gs: np.ndarray, sigma_r: int) -> np.ndarray:
+    m, n = forma
+    k, l = Gs.shape
+    pad_h, pad_w = k//2, l//2
+    centro = imagen_padded[pad_h:pad_h+m, pad_w:pad_w+n]
+
+    # Se recorre la máscara y no los píxeles: cada posición aporta a todos a la vez
+    numerador = np.zeros(centro.shape, dtype=tipo_de_calculo(tipo=imagen_padded.dtype))
+    Wx = np.zeros((m, n), dtype=numerador.dtype)
+    Gs = Gs.astype(Wx.dtype, copy=False)
+    for (u, v), peso in np.ndenumerate(Gs):
+        vecino = imagen_padded[u:u+m, v:v+n]
+        dif = vecino - centro
+        distancia = dif**2 if dif.ndim == 2 else np.sum(dif**2, axis=2)
+        G = peso * np.exp(-(distancia / (2 * sigma_r**2)))
+        Wx += G
+        numerador += vecino * G.reshape(G.shape + (1,) * (vecino.ndim - 2))
+
+    return numerador / Wx.reshape(Wx.shape + (1,) * (numerador.ndim - 2))
 
-            G = Gs * Gr
-            G = G[:, :, np.newaxis]
+# ================================((UMBRALIZACIÓN))======================================
 
-            valor = (1 / Wx) * np.sum(region * G, axis=(0, 1))
-            #print(f"Shape de valor: {valor.shape}")
-            
-            imagen_filtrada[i, j, :] = valor
-    
-    resultado_np = escalar_255(imagen_filtrada)
-    return resultado_np
+# Las binarizaciones reciben histograma= con los conteos de la imagen si ya se tienen
+# (ej. de calcular_histogramas) para no volver a contarlos
 
-# ================================((UMBRALIZACIÓN))======================================
+def _histograma_de(imagen_np: np.ndarray, histograma: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Devuelve histograma, o los conteos de los 256 niveles de la imagen si es None.
+    """
+    if histograma is not None:
+        return histograma
+    niveles = imagen_np if imagen_np.dtype == np.uint8 else imagen_np.astype(np.uint8)
+    return np.bincount(niveles.reshape(-1), minlength=256)
 
 # --- Cálculo iterativo del umbral (escala de grises) ---
 
-def aplicar_umbralizacion_iterativa(imagen_np: np.ndarray, n: int = 50) -> np.ndarray:
-    T = int(np.mean(imagen_np))
+def umbral_iterativo(histograma: np.ndarray, n: int = 50) -> dict:
+    """
+    Umbral óptimo iterativo calculado sobre el histograma (cada paso es O(256)).
+    Devuelve {'umbral': T, 'iteraciones': pasos hechos hasta que T dejó de cambiar}.
+    """
+    # C[t] y S[t]: cantidad y suma de intensidades de los niveles < t
+    C = np.concatenate(([0], np.cumsum(histograma)))
+    S = np.concatenate(([0], np.cumsum(np.arange(256) * histograma)))
+    N, suma_total = C[256], S[256]
+
+    T = int(suma_total / N) # Promedio de la imagen
     T_anterior = -1
+    iteraciones = 0
 
-    for i in range(n):
-        if T == T_anterior: break
+    while T != T_anterior and iteraciones < n:
         T_anterior = T
 
-        imagen_binaria = aplicar_umbralizacion(imagen_np, T)
-        nG1 = np.sum(imagen_binaria == 255)
-        nG2 = np.sum(imagen_binaria == 0)
+        nG1 = N - C[T] # Píxeles >= T
+        nG2 = C[T]
+        if nG1 == 0 or nG2 == 0: break # Un grupo vacío: el umbral no puede moverse
 
-        m1 = (1 / nG1) * np.sum(imagen_np[imagen_binaria == 255])
-        m2 = (1 / nG2) * np.sum(imagen_np[imagen_binaria == 0])
+        m1 = (suma_total - S[T]) / nG1
+        m2 = S[T] / nG2
 
         T = int(0.5 * (m1 + m2))
-        #print(f"T={T} en iteración {i+1}/{n}")
+        iteraciones += 1
 
-    print(f"Valor de umbral utilizado(T) = {T} en iteración {i}/{n}")
-    resultado_np = aplicar_umbralizacion(imagen_np, T)
+    return {'umbral': T, 'iteraciones': iteraciones}
 
-    return resultado_np
+def aplicar_umbralizacion_iterativa(imagen_np: np.ndarray, n: int = 50, out: Optional[np.ndarray] = None, histograma: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Binariza con el umbral de umbral_iterativo; sólo la binarización final (con una
+    tabla) recorre los píxeles.
+    Pura (out -> array uint8 donde escribir la imagen binaria).
+    """
+    T = umbral_iterativo(_histograma_de(imagen_np, histograma), n)['umbral']
+    resultado_np = aplicar_cadena_puntual(imagen_np, [lut_umbralizacion(T)], out=out)
 
-def aplicar_umbralizacion_de_otsu(imagen_np: np.ndarray) -> np.ndarray:
-    imagen_np = imagen_np.astype(np.uint8)
-    datos_gris = imagen_np.flatten()
+    return resultado_np
 
+def umbral_de_otsu(histograma: np.ndarray) -> np.ndarray:
+    """
+    Umbral de Otsu de uno o varios histogramas (..., 256) a la vez.
+    """
     intensidad = np.arange(256)
-    fi = np.bincount(datos_gris, minlength=256) 
-    N = datos_gris.size
-    pi = fi / N
-
-    # Computar las sumas acumuladas (array) y promedios ponderados (array)
-    P1 = np.zeros(256)
-    m = np.zeros(256)
-    for t in range(256):
-        P1[t] = np.sum(pi[0:t+1])
-        m[t] = np.sum(intensidad[0:t+1] * pi[0:t+1])
+    fi = np.asarray(histograma)
+    N = fi.sum(axis=-1, keepdims=True)
+
+    # Computar las sumas acumuladas (array) y promedios ponderados (array), sobre los
+    # conteos enteros para que sean exactas
+    acumulado = np.cumsum(fi, axis=-1)
+    P1 = acumulado / N
+    m = np.cumsum(intensidad * fi, axis=-1) / N
     
-    # Computar el promedio ponderado global (escalar)
-    mG = m[255] # np.sum(intensidad * pi)
+    # Computar el promedio ponderado global
+    mG = m[..., 255:] # np.sum(intensidad * pi)
+
+    # Computar la varianza entre clases (donde las dos clases tienen píxeles)
+    validos = (acumulado > 0) & (acumulado < N)
+    sigma_B = np.zeros(fi.shape)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide((mG * P1 - m)**2, P1 * (1 - P1), out=sigma_B, where=validos)
 
-    # Computar la varianza entre clases
-    sigma_B = np.zeros(256)
-    for t in range(256):
-        if P1[t] > 0 and P1[t] < 1:
-            sigma_B[t] = ((mG * P1[t] - m[t])**2) / (P1[t] * (1 - P1[t]))
+    return np.argmax(sigma_B, axis=-1)
+
+def aplicar_umbralizacion_de_otsu(imagen_np: np.ndarray, out: Optional[np.ndarray] = None, histograma: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Pura (out -> array uint8 donde escribir la imagen binaria).
+    """
+    if imagen_np.dtype != np.uint8:
+        imagen_np = imagen_np.astype(np.uint8)
 
-    t_estrella = np.argmax(sigma_B)
+    t_estrella = int(umbral_de_otsu(_histograma_de(imagen_np, histograma)))
 
     print(f"Valor de umbral utilizado(T) = {t_estrella}")
-    resultado_np = aplicar_umbralizacion(imagen_np, t_estrella)
+    resultado_np = aplicar_umbralizacion(imagen_np, t_estrella, out=out)
 
     return resultado_np
 
-def aplicar_umbralizacion_rgb(imagen_np: np.ndarray) -> np.ndarray:
-    banda_r = imagen_np[:, :, 0]
-    banda_g = imagen_np[:, :, 1]
-    banda_b = imagen_np[:, :, 2]
+# --- Otsu multinivel
+
+def umbrales_de_otsu(histograma: np.ndarray, clases: int) -> np.ndarray:
+    """
+    Umbrales t_1 < ... < t_(clases-1) que maximizan la varianza entre clases; la
+    clase j son los niveles [t_j, t_(j+1)). Programación dinámica sobre los momentos
+    de cada rango de niveles, que salen de sumas acumuladas.
+    """
+    # P[a] y M[a]: cantidad y suma de intensidades de los niveles < a
+    P = np.concatenate(([0], np.cumsum(histograma))).astype(np.float64)
+    M = np.concatenate(([0], np.cumsum(np.arange(256) * histograma))).astype(np.float64)
+
+    # aporte[a, b] = w * mu^2 de la clase [a, b) (sin normalizar; no cambia el máximo)
+    peso = P[None, :] - P[:, None]
+    suma = M[None, :] - M[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        aporte = np.where(peso > 0, suma**2 / peso, 0.0)
+    aporte[np.tril_indices(257)] = -np.inf # Cada clase tiene al menos un nivel
+
+    # mejor[b]: mejor valor para partir [0, b) en las clases vistas hasta ahora
+    mejor = aporte[0]
+    cortes = []
+    for _ in range(clases - 1):
+        candidatos = mejor[:, None] + aporte
+        cortes.append(np.argmax(candidatos, axis=0))
+        mejor = np.max(candidatos, axis=0)
+
+    # Se reconstruyen los umbrales desde el final (256)
+    umbrales = []
+    fin = 256
+    for corte in reversed(cortes):
+        fin = int(corte[fin])
+        umbrales.append(fin)
+    return np.array(umbrales[::-1])
+
+def aplicar_umbralizacion_multinivel(imagen_np: np.ndarray, clases: int = 3, out: Optional[np.ndarray] = None, histograma: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Otsu con varias clases: cada clase se pinta con un gris equiespaciado entre 0 y 255.
+    Pura (out -> array uint8 donde escribir).
+    """
+    umbrales = umbrales_de_otsu(_histograma_de(imagen_np, histograma), clases)
+    print(f"Valores de umbral utilizados(T) = {umbrales.tolist()}")
+
+    clase = np.searchsorted(umbrales, NIVELES, side='right') # Clase de cada nivel
+    lut = np.round(clase * 255 / (clases - 1)).astype(np.uint8)
+    return aplicar_cadena_puntual(imagen_np, [lut], out=out)
+
+# Operadores que conviene recibir en uint8 (sin pasar a float) para usar su tabla
+OPERADORES_PUNTUALES = (aplicar_gamma, aplicar_umbralizacion, aplicar_negativo, aplicar_ecualizacion_histograma, aplicar_clahe,
+                        aplicar_umbralizacion_multinivel)
 
-    banda_r = aplicar_umbralizacion_de_otsu(banda_r)
-    banda_g = aplicar_umbralizacion_de_otsu(banda_g)
-    banda_b = aplicar_umbralizacion_de_otsu(banda_b)
+def _a_filas(imagen_np: np.ndarray) -> np.ndarray:
+    """
+    Vista uint8 contigua (imágenes, filas, ancho * canales) de una imagen (alto, ancho,
+    canales) o de una pila (..., alto, ancho, canales): así un valor por canal se aplica
+    con una fila repetida en vez de difundir sobre un eje de 3 elementos, que es mucho
+    más lento.
+    """
+    if imagen_np.dtype != np.uint8 or not imagen_np.flags.c_contiguous:
+        niveles = tomar_buffer(imagen_np.shape, np.uint8, "_a_filas")
+        np.copyto(niveles, imagen_np, casting='unsafe')
+        imagen_np = niveles
+    alto, ancho, canales = imagen_np.shape[-3:]
+    return imagen_np.reshape(-1, alto, ancho * canales)
+
+def _por_fila(valores: np.ndarray, ancho: int) -> np.ndarray:
+    """Valores (imágenes, canales) repetidos a lo largo de una fila: (imágenes, 1, ancho * canales)."""
+    return np.tile(valores, ancho)[:, None, :]
+
+def histogramas_por_canal(imagen_np: np.ndarray) -> np.ndarray:
+    """
+    Conteos (..., canales, 256) de cada canal de una imagen (alto, ancho, canales) o de
+    cada imagen de una pila (..., alto, ancho, canales), todos con un único bincount:
+    el canal c de la imagen i se corre (i * canales + c) * 256 lugares.
+    """
+    forma_pila, (ancho, canales) = imagen_np.shape[:-3], imagen_np.shape[-2:]
+    filas = _a_filas(imagen_np)
+    histogramas = filas.shape[0] * canales
+    tipo = np.uint16 if histogramas <= 256 else np.uint32
+    desplazamientos = np.arange(histogramas, dtype=tipo).reshape(-1, canales) * 256
+    indices = tomar_buffer(filas.shape, tipo, "histogramas_por_canal")
+    np.add(filas, _por_fila(desplazamientos, ancho), out=indices)
+    conteos = np.bincount(indices.reshape(-1), minlength=histogramas * 256)
+    return conteos.reshape(forma_pila + (canales, 256))
+
+def aplicar_umbralizacion_rgb(imagen_np: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Otsu por canal, con los histogramas y los umbrales de todos los canales calculados
+    juntos. Sirve para cualquier cantidad de canales y para pilas de imágenes
+    (..., alto, ancho, canales), donde cada imagen tiene sus propios umbrales.
+    Pura (out -> array uint8 donde escribir).
+    """
+    if imagen_np.ndim == 2: # Imagen gris: una sola banda
+        return aplicar_umbralizacion_de_otsu(imagen_np, out=out)
 
-    resultado_np = np.dstack([banda_r, banda_g, banda_b])
+    filas = _a_filas(imagen_np) # Se pasa a uint8 una sola vez
+    umbrales = umbral_de_otsu(histogramas_por_canal(filas.reshape(imagen_np.shape)))
+    print(f"Valores de umbral utilizados(T) por canal = {umbrales.tolist()}")
 
-    # https://numpy.org/doc/stable/reference/generated/numpy.dstack.html
-    return resultado_np
\ No newline at end of file
+    # Todos los canales se binarizan en una pasada, directo sobre el resultado
+    umbrales_por_fila = _por_fila(umbrales.reshape(filas.shape[0], -1).astype(np.uint8), imagen_np.shape[-2])
+    mascara = np.greater_equal(filas, umbrales_por_fila, out=tomar_buffer(filas.shape, bool, "aplicar_umbralizacion_rgb"))
+    resultado_np = out if out is not None else np.empty(imagen_np.shape, dtype=np.uint8)
+    np.multiply(mascara.reshape(imagen_np.shape), np.uint8(255), out=resultado_np)
+
+    return resultado_np
@@ -6,7 +6,7 @@ import numpy as np
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
-from processing import (aplicar_gamma, aplicar_umbralizacion, generar_vector_ruido, aplicar_ruido, aplicar_ruido_sal_y_pimienta,
+from processing import (aplicar_gamma, aplicar_umbralizacion, generar_vector_ruido, aplicar_ruido, aplicar_ruido_sal_y_pimienta, cantidad_de_contaminados,
                         aplicar_filtro, aplicar_metodo_del_laplaciano, aplicar_filtro_difusion, aplicar_filtro_bilateral
                         )
 
@@ -183,12 +183,24 @@ class DialogoRecorteConAnalisis(DialogoBase):
 class DialogoHerramienta(DialogoBase):
     """
     Plantilla base para ventanas de herramientas con parámetros.
+
+    Las vistas previas en vivo (sliders) se piden con _programar_vista_previa: de los
+    valores que llegan mientras se calcula sólo se usa el último, se calculan sobre una
+    copia reducida al tamaño en pantalla y el resultado a resolución completa se calcula
+    cuando el usuario deja de mover el control o al aplicar.
     """
+    DEMORA_RESOLUCION_COMPLETA_MS = 400
+
     def __init__(self, parent, app_principal, titulo: str):
         super().__init__(parent)
         self.app = app_principal
         self.title(titulo)
 
+        self._vista_previa_pendiente = None # Último pedido (funcion, args, kwargs)
+        self._id_vista_previa = None
+        self._id_resolucion_completa = None
+        self._proxy = None # (imagen de origen, tamaño, copia reducida)
+
         self.icono_aceptar = tk.PhotoImage(file="icons/aceptar.png").subsample(5,5)
         self.icono_cancelar = tk.PhotoImage(file="icons/cancelar.png").subsample(5,5)
         
@@ -212,6 +224,57 @@ class DialogoHerramienta(DialogoBase):
     def _on_cancel(self):
         self.destroy()
 
+    def destroy(self):
+        self._cancelar_vista_previa()
+        super().destroy()
+
+    # --- Vista previa en vivo
+
+    def _programar_vista_previa(self, funcion, *args, **kwargs):
+        """
+        Pide una vista previa de funcion sobre self.copia_imagen. Los pedidos que llegan
+        antes de que se dibuje la anterior la reemplazan.
+        """
+        self._vista_previa_pendiente = (funcion, args, kwargs)
+        if self._id_vista_previa is None:
+            self._id_vista_previa = self.after_idle(self._dibujar_vista_previa)
+        if self._id_resolucion_completa is not None:
+            self.after_cancel(self._id_resolucion_completa)
+        self._id_resolucion_completa = self.after(self.DEMORA_RESOLUCION_COMPLETA_MS, self._aplicar_resolucion_completa)
+
+    def _cancelar_vista_previa(self):
+        for id_tarea in (self._id_vista_previa, self._id_resolucion_completa):
+            if id_tarea is not None:
+                self.after_cancel(id_tarea)
+        self._id_vista_previa = self._id_resolucion_completa = None
+        self._vista_previa_pendiente = None
+
+    def _imagen_reducida(self) -> Image.Image:
+        """Copia de la imagen de trabajo al tamaño en pantalla (nunca más grande que la original)."""
+        w, h = self.copia_imagen.size
+        escala = min(1.0, self.app.zoom_level)
+        tamano = (max(1, int(w * escala)), max(1, int(h * escala)))
+        if self._proxy is None or self._proxy[0] is not self.copia_imagen or self._proxy[1] != tamano:
+            reducida = self.copia_imagen if tamano == (w, h) else self.copia_imagen.resize(tamano, Image.Resampling.BILINEAR)
+            self._proxy = (self.copia_imagen, tamano, reducida)
+        return self._proxy[2]
+
+    def _dibujar_vista_previa(self):
+        self._id_vista_previa = None
+        if self._vista_previa_pendiente is None:
+            return
+        funcion, args, kwargs = self._vista_previa_pendiente
+        vista_previa = self.app._calcular_transformacion(self._imagen_reducida(), funcion, *args, **kwargs)
+        self.app._mostrar_vista_previa(vista_previa)
+
+    def _aplicar_resolucion_completa(self):
+        self._id_resolucion_completa = None
+        if self._vista_previa_pendiente is None:
+            return
+        funcion, args, kwargs = self._vista_previa_pendiente
+        self._cancelar_vista_previa()
+        self.app._aplicar_transformacion(self.copia_imagen, funcion, *args, **kwargs)
+
 class DialogoGamma(DialogoHerramienta):
     """
     Diálogo para introducir el valor de Gamma y realizar la transformación.
@@ -234,13 +297,14 @@ class DialogoGamma(DialogoHerramienta):
             resolution=0.1,
             showvalue=True,
             length=200,
-            command=lambda value: self.app._aplicar_transformacion(self.copia_imagen, aplicar_gamma, gamma=float(value))
+            command=lambda value: self._programar_vista_previa(aplicar_gamma, gamma=float(value))
             ).pack(padx=5, pady=5)
         
         self._finalizar_y_posicionar(self.app.canvas_izquierdo)
 
     def _on_apply(self):
         gamma = float(self.valor_gamma.get())
+        self._cancelar_vista_previa()
         self.app._aplicar_transformacion(self.copia_imagen, aplicar_gamma, gamma=gamma)
         self.destroy()
     
@@ -270,13 +334,14 @@ class DialogoUmbralizacion(DialogoHerramienta):
             resolution=1,
             showvalue=True,
             length=350,
-            command=lambda value: self.app._aplicar_transformacion(self.copia_imagen, aplicar_umbralizacion, float(value))
+            command=lambda value: self._programar_vista_previa(aplicar_umbralizacion, float(value))
             ).pack(padx=5, pady=5)
         
         self._finalizar_y_posicionar(self.app.canvas_izquierdo)
 
     def _on_apply(self):
         umbral = float(self.valor_umbral.get())
+        self._cancelar_vista_previa()
         self.app._aplicar_transformacion(self.copia_imagen, aplicar_umbralizacion, umbral=umbral)
         self.destroy()
     
@@ -294,8 +359,9 @@ class DialogoHistogramas(DialogoBase):
         self.app = app_principal
         self.title("Histogramas de la Imagen")
 
-        # Pide los datos a la aplicación principal
-        datos = self.app._tomar_niveles_grisrgb_aplanados()
+        # Pide los conteos a la aplicación principal (se calculan una vez por imagen)
+        datos = self.app._tomar_histogramas()
+        bordes = np.arange(257)
 
         # Guarda la figura y los ejes como atributos de la instancia
         self.fig = Figure(figsize=(9, 7), dpi=100)
@@ -304,19 +370,19 @@ class DialogoHistogramas(DialogoBase):
         self.fig.suptitle('Histogramas de Canales de Color y Niveles de Gris', fontsize=14)
 
         # Dibuja los 4 histogramas
-        self.ax_gris.hist(datos['gris'], bins=256, range=[0, 256], color='gray', density=True)
+        self.ax_gris.stairs(datos['gris'] / datos['gris'].sum(), bordes, fill=True, color='gray')
         self.ax_gris.set_title("Niveles de Gris")
         self.ax_gris.grid(True, linestyle='--')
 
-        self.ax_rojo.hist(datos['rojo'], bins=256, range=[0, 256], color='red', density=True)
+        self.ax_rojo.stairs(datos['rojo'] / datos['rojo'].sum(), bordes, fill=True, color='red')
         self.ax_rojo.set_title("Canal Rojo")
         self.ax_rojo.grid(True, linestyle='--')
 
-        self.ax_verde.hist(datos['verde'], bins=256, range=[0, 256], color='green', density=True)
+        self.ax_verde.stairs(datos['verde'] / datos['verde'].sum(), bordes, fill=True, color='green')
         self.ax_verde.set_title("Canal Verde")
         self.ax_verde.grid(True, linestyle='--')
 
-        self.ax_azul.hist(datos['azul'], bins=256, range=[0, 256], color='blue', density=True)
+        self.ax_azul.stairs(datos['azul'] / datos['azul'].sum(), bordes, fill=True, color='blue')
         self.ax_azul.set_title("Canal Azul")
         self.ax_azul.grid(True, linestyle='--')
         
@@ -504,18 +570,11 @@ class DialogoRuido(DialogoHerramienta):
             intensidad = int(self.intensidad.get())
             tipo = str(self.tipo.get())
 
-            imagen_np = np.array(self.app.imagen_procesada)
-            m, n = imagen_np.shape[:2]
-            num_contaminados = int((d * (m * n)) / 100)
-
-            vector_ruido = generar_vector_ruido(
-                distribucion=self.config['distribucion'],
-                intensidad=intensidad,
-                cantidad=num_contaminados
-            )
-
-            if vector_ruido.size > 0:
-                self.app._aplicar_transformacion(self.copia_imagen, aplicar_ruido, tipo=tipo, vector_ruido=vector_ruido, d=d)
+            ancho, alto = self.copia_imagen.size # Sólo hace falta la forma, no los píxeles
+            if cantidad_de_contaminados((alto, ancho), d) > 0:
+                # El vector de ruido se genera junto con los píxeles elegidos
+                self.app._aplicar_transformacion(self.copia_imagen, aplicar_ruido, tipo=tipo, d=d,
+                                                 distribucion=self.config['distribucion'], intensidad=intensidad)
         else:
             d = int(self.valor_d.get()) / 2
             p = d / 100
@@ -567,6 +626,12 @@ class DialogoFiltro(DialogoHerramienta):
             self.label_sigma = ttk.Label(label_parametros, text=f"Tamaño de máscara correspondiente (k): {int((int(self.tam_filtro.get())*2)+1)}")
             self.label_sigma.pack(padx=5, pady=(0, 10))
 
+        self.borde = tk.StringVar(value="constant")
+        label_borde = ttk.Labelframe(self.frame_herramienta, text="Borde:", padding=10)
+        label_borde.pack(fill="x", padx=10, pady=5, expand=True)
+        for texto, modo in (("Ceros", "constant"), ("Espejo", "reflect"), ("Replicar", "replicate"), ("Periódico", "wrap")):
+            ttk.Radiobutton(label_borde, text=texto, variable=self.borde, value=modo).pack(side="left", padx=5)
+
         self._finalizar_y_posicionar(self.app.canvas_izquierdo)
     
     def _actualizar_valor(self, valor):
@@ -577,7 +642,7 @@ class DialogoFiltro(DialogoHerramienta):
 
     def _on_apply(self):
         k = int(self.tam_filtro.get())
-        self.app._aplicar_transformacion(self.copia_imagen, aplicar_filtro, func_filtro=self.func_filtro, k=k, modo=self.modo, mediana=self.mediana)
+        self.app._aplicar_transformacion(self.copia_imagen, aplicar_filtro, func_filtro=self.func_filtro, k=k, modo=self.modo, mediana=self.mediana, borde=self.borde.get())
         self.destroy()
     
     def _on_cancel(self):